@@ -9,6 +9,9 @@ That is, changing the formal parameters of a function will break the
 interface and triggers to a fail for the test of your code.
 '''
 import math
+import functools
+import itertools
+import numpy as np
 import search
 import sokoban
 from collections import deque
@@ -114,6 +117,76 @@ def getTabooCellsList(walls: [(int, int)], targets: [(int, int)]) -> [(int, int)
     return list(taboo_cell_set)
 
 
+def getTabooCellsArray(walls: [(int, int)], targets: [(int, int)]) -> [(int, int)]:
+    '''
+    Same taboo cells as getTabooCellsList, computed with array operations
+    over boolean masks of the grid instead of one WarehouseCell per cell.
+    '''
+    num_of_row, num_of_col = (max(y for _, y in walls) + 1), (max(x for x, _ in walls) + 1)
+    wall: np.ndarray = np.zeros((num_of_row, num_of_col), dtype=bool)
+    wall[tuple(zip(*walls))[::-1]] = True
+    target: np.ndarray = np.zeros_like(wall)
+    target_in_grid: [(int, int)] = [(x, y) for x, y in targets if 0 <= x < num_of_col and 0 <= y < num_of_row]
+    if target_in_grid:
+        target[tuple(zip(*target_in_grid))[::-1]] = True
+
+    # Wall on each side of every cell, cells outside the grid are not walls
+    padded: np.ndarray = np.pad(wall, 1)
+    wall_left, wall_right = padded[1:-1, :-2], padded[1:-1, 2:]
+    wall_up, wall_down = padded[:-2, 1:-1], padded[2:, 1:-1]
+
+    # Walls anywhere strictly before / after each cell along its row and column
+    wall_before_x: np.ndarray = np.logical_or.accumulate(padded[1:-1, :-2], axis=1)
+    wall_after_x: np.ndarray = np.logical_or.accumulate(padded[1:-1, :1:-1], axis=1)[:, ::-1]
+    wall_before_y: np.ndarray = np.logical_or.accumulate(padded[:-2, 1:-1], axis=0)
+    wall_after_y: np.ndarray = np.logical_or.accumulate(padded[:1:-1, 1:-1], axis=0)[::-1, :]
+
+    # A dead corner is a non-target floor cell with a wall on each axis
+    corner: np.ndarray = ~wall & ~target & (wall_left | wall_right) & (wall_up | wall_down)
+    open_right, open_left = wall_left & ~wall_right, wall_right & ~wall_left
+    open_down, open_up = wall_up & ~wall_down, wall_down & ~wall_up
+
+    # Rule 1: a corner with a wall further along its free direction
+    taboo: np.ndarray = corner & ((open_right & wall_after_x) | (open_left & wall_before_x) |
+                                  (open_down & wall_after_y) | (open_up & wall_before_y))
+
+    # Rule 2: the cells between two facing corners along a wall, on rows then on columns
+    taboo |= getTabooRuns(corner, open_right, open_left, target, wall_up, wall_down)
+    taboo |= getTabooRuns(corner.T, open_down.T, open_up.T, target.T, wall_left.T, wall_right.T).T
+
+    return [(x, y) for y, x in zip(*np.nonzero(taboo))]
+
+def getTabooRuns(corner: np.ndarray, open_after: np.ndarray, open_before: np.ndarray, target: np.ndarray,
+                 wall_side_a: np.ndarray, wall_side_b: np.ndarray) -> np.ndarray:
+    '''
+    Mark the cells strictly between each corner open towards larger columns
+    and the next corner of its row, if that one is open towards smaller
+    columns, none of the cells between is a target and all of them have a
+    wall on side a or all of them have a wall on side b.
+    '''
+    runs: np.ndarray = np.zeros(corner.shape, dtype=bool)
+    rows, cols = np.nonzero(corner)
+    pair: np.ndarray = (rows[:-1] == rows[1:]) & open_after[rows[:-1], cols[:-1]] & open_before[rows[1:], cols[1:]]
+    pair &= cols[1:] - cols[:-1] > 1
+    rows, starts, ends = rows[:-1][pair], cols[:-1][pair] + 1, cols[1:][pair]
+    if rows.size == 0:
+        return runs
+
+    def count_between(mask: np.ndarray) -> np.ndarray:
+        prefix: np.ndarray = np.pad(np.cumsum(mask, axis=1), ((0, 0), (1, 0)))
+        return prefix[rows, ends] - prefix[rows, starts]
+
+    length: np.ndarray = ends - starts
+    keep: np.ndarray = (count_between(target) == 0) & ((count_between(wall_side_a) == length) | (count_between(wall_side_b) == length))
+    rows, starts, ends = rows[keep], starts[keep], ends[keep]
+
+    cover: np.ndarray = np.zeros((corner.shape[0], corner.shape[1] + 1), dtype=np.int32)
+    np.add.at(cover, (rows, starts), 1)
+    np.add.at(cover, (rows, ends), -1)
+    runs |= np.cumsum(cover, axis=1)[:, :-1] > 0
+    return runs
+
+
 def taboo_cells(warehouse):
     '''  
     Identify the taboo cells of a warehouse. A cell inside a warehouse is 
@@ -135,13 +208,8 @@ def taboo_cells(warehouse):
        The returned string should NOT have marks for the worker, the targets,
        and the boxes.  
     '''
-    walls: [(int, int)] = warehouse.walls
-    targets: [(int, int)] = warehouse.targets
-
-    num_of_row, num_of_col = (max(y for _, y in walls) + 1), (max(x for x, _ in walls) + 1)
-    taboo_cell: [(int, int)] = getTabooCellsList(walls, targets)
-
-    return getTabooMapString(num_of_row, num_of_col, walls, taboo_cell)
+    index: WarehouseIndex = get_warehouse_index(warehouse)
+    return getTabooMapString(index.num_of_row, index.num_of_col, index.walls, index.taboo_cells)
 
 
 WALL = '#'
@@ -231,6 +299,382 @@ def checkContinueWalls(cells: [WarehouseCell], wall_direction: (int, int)) -> bo
     return True
 
 
+class WarehouseIndex(object):
+    '''
+    Static analysis of a warehouse, that is everything which depends only on
+    its walls and targets. It is built once per warehouse layout by
+    get_warehouse_index and shared by all the solver functions.
+
+    Floor cells are the non-wall cells inside the bounding box of the walls,
+    numbered in row-major order. Sets of cells (boxes, targets, taboo cells)
+    are stored as bitmasks over these cell indices.
+    '''
+    def __init__(self, warehouse):
+        self.walls: set[(int, int)] = set(warehouse.walls)
+        self.targets: [(int, int)] = list(warehouse.targets)
+        self.num_of_row: int = max(y for _, y in self.walls) + 1
+        self.num_of_col: int = max(x for x, _ in self.walls) + 1
+
+        self.cells, self.cell_index = get_floor_cells(self.walls, self.num_of_row, self.num_of_col)
+        self.neighbours: [(int, int, int, int)] = get_neighbour_table(self.cells, self.cell_index)
+        self.target_mask: int = encode_cells(self.targets, self.cell_index)
+        self.cells_mask: int = (1 << len(self.cells)) - 1
+
+        # boxes bitboard -> bitmasks of the worker regions found so far
+        self.region_cache: dict = {}
+        # (worker, boxes bitboard) -> walking distances of the worker
+        self.distance_cache: dict = {}
+
+    def reachable_region(self, worker: int, boxes: int) -> int:
+        '''
+        Return the bitmask of the cells the worker can walk to from the cell
+        'worker' around the boxes of the bitboard 'boxes'. Regions are cached
+        per box configuration, so later queries from any cell of a known
+        region are lookups.
+        '''
+        regions: [int] = self.region_cache.get(boxes)
+        if regions is None:
+            if len(self.region_cache) >= REGION_CACHE_SIZE:
+                self.region_cache.clear()
+            regions = self.region_cache[boxes] = []
+        for region in regions:
+            if region >> worker & 1:
+                return region
+        region: int = get_reachable_cells(worker, boxes, self.neighbours)
+        regions.append(region)
+        return region
+
+    def worker_distances(self, worker: int, boxes: int) -> [int]:
+        '''
+        Return the number of moves the worker needs to walk from the cell
+        'worker' to every cell without pushing the boxes of the bitboard
+        'boxes', -1 for the cells it cannot reach. Distance fields are cached
+        per worker cell and box configuration.
+        '''
+        key: (int, int) = (worker, boxes)
+        distances: [int] = self.distance_cache.get(key)
+        if distances is None:
+            if len(self.distance_cache) >= DISTANCE_CACHE_SIZE:
+                self.distance_cache.clear()
+            distances = self.distance_cache[key] = get_worker_distances(worker, boxes, self.neighbours)
+        return distances
+
+    def clear_search_caches(self):
+        '''
+        Empty the region and distance caches, which fill up during a search,
+        keeping the static analysis of the warehouse.
+        '''
+        self.region_cache.clear()
+        self.distance_cache.clear()
+
+    def push_region(self, region: int, boxes_new: int, box: int, box_new: int) -> int:
+        '''
+        Return the region of the worker after it pushed the box on cell 'box'
+        to the cell 'box_new', given the region 'region' it had before the push
+        and the box bitboard 'boxes_new' after it. Only the area around the
+        two cells that changed is searched, unless the box now cuts the old
+        region in two. The result is added to the region cache.
+        '''
+        regions: [int] = self.region_cache.get(boxes_new)
+        if regions is not None:
+            for cached_region in regions:
+                if cached_region >> box & 1:
+                    return cached_region
+
+        if region >> box_new & 1 and self.may_split(box_new, boxes_new):
+            region = get_reachable_cells(box, boxes_new, self.neighbours)
+        else:
+            # the freed cell joins the region, together with the areas it opens
+            region = (region | 1 << box) & ~(1 << box_new)
+            for cell in self.neighbours[box]:
+                if cell >= 0 and not (region | boxes_new) >> cell & 1:
+                    region |= get_connected_cells(cell, self.cells_mask & ~boxes_new & ~region, self.neighbours)
+
+        if regions is None:
+            if len(self.region_cache) >= REGION_CACHE_SIZE:
+                self.region_cache.clear()
+            regions = self.region_cache[boxes_new] = []
+        regions.append(region)
+        return region
+
+    def may_split(self, cell: int, boxes: int) -> bool:
+        '''
+        Return False if the free neighbours of 'cell' are connected through the
+        free cells of the ring of 8 cells around it, in which case blocking
+        'cell' cannot split a region.
+        '''
+        ring: (int, ...) = self.rings[cell]
+        free: [bool] = [ring_cell >= 0 and not boxes >> ring_cell & 1 for ring_cell in ring]
+        if all(free):
+            return False
+        start: int = free.index(False)
+        num_of_runs: int = 0  # runs of free ring cells holding a neighbour of the cell
+        in_run, run_has_neighbour = False, False
+        for offset in range(1, len(ring) + 1):
+            position: int = (start + offset) % len(ring)
+            if free[position]:
+                in_run = True
+                run_has_neighbour = run_has_neighbour or position % 2 == 0
+            elif in_run:
+                num_of_runs += run_has_neighbour
+                in_run, run_has_neighbour = False, False
+        return num_of_runs > 1
+
+    @functools.cached_property
+    def rings(self) -> [(int, ...)]:
+        '''
+        For each cell, the indices of the 8 cells around it (-1 for a wall)
+        in clockwise order starting from the cell above, so that its four
+        neighbours are at the even positions.
+        '''
+        offsets: [(int, int)] = [(0, -1), (1, -1), (1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1)]
+        return [tuple(self.cell_index.get((x + dx, y + dy), -1) for dx, dy in offsets) for x, y in self.cells]
+
+    @functools.cached_property
+    def taboo_cells(self) -> [(int, int)]:
+        return getTabooCellsArray(list(self.walls), self.targets)
+
+    @functools.cached_property
+    def taboo_mask(self) -> int:
+        '''
+        Bitmask of the cells a box must never be pushed onto: the taboo cells
+        of the two rules, plus the dead cells from which no target can be reached.
+        '''
+        return encode_cells(self.taboo_cells, self.cell_index) | self.dead_mask
+
+    @functools.cached_property
+    def push_distances(self) -> np.ndarray:
+        '''
+        Array of shape (number of targets, number of cells), in which
+        push_distances[i, c] is the minimum number of pushes needed to move a
+        box from cell c to the i-th target (targets in cell order), ignoring
+        the other boxes. Cells from which the target cannot be reached get
+        len(cells). Computed by a reverse BFS of pull moves from each target.
+        '''
+        num_of_cells: int = len(self.cells)
+        distances: np.ndarray = np.full((bin(self.target_mask).count('1'), num_of_cells), num_of_cells, dtype=np.int32)
+        for row, target in enumerate(iter_bits(self.target_mask)):
+            distances[row] = get_push_distances(target, self.neighbours)
+        return distances
+
+    @functools.cached_property
+    def dead_mask(self) -> int:
+        '''
+        Bitmask of the dead cells, from which no box can be pushed to any target.
+        '''
+        dead_cells: np.ndarray = np.flatnonzero(self.push_distances.min(axis=0, initial=len(self.cells)) >= len(self.cells))
+        mask: int = 0
+        for cell in dead_cells.tolist():
+            mask |= 1 << cell
+        return mask
+
+
+warehouse_index_cache: dict = {}
+WAREHOUSE_INDEX_CACHE_SIZE = 128
+REGION_CACHE_SIZE = 1 << 16
+DISTANCE_CACHE_SIZE = 1 << 14
+MATCHING_CACHE_SIZE = 1 << 16
+
+def get_warehouse_index(warehouse) -> WarehouseIndex:
+    '''
+    Return the WarehouseIndex of the layout of 'warehouse', building it only
+    the first time this layout (walls and targets) is seen.
+    '''
+    key = (tuple(sorted(warehouse.walls)), tuple(sorted(warehouse.targets)))
+    index: WarehouseIndex = warehouse_index_cache.get(key)
+    if index is None:
+        index = WarehouseIndex(warehouse)
+        if len(warehouse_index_cache) >= WAREHOUSE_INDEX_CACHE_SIZE:
+            del warehouse_index_cache[next(iter(warehouse_index_cache))]  # drop the oldest
+        warehouse_index_cache[key] = index
+    return index
+
+
+class BoxTargetMatching(object):
+    '''
+    Lower bound on the number of pushes needed to solve a box configuration:
+    the cost of a minimum cost perfect matching of the boxes to the targets,
+    where matching a box to a target costs the distance between them in
+    'distances' (one row per target, giving the distance from every cell).
+
+    The matching is found with the Hungarian algorithm (shortest augmenting
+    paths with row potentials u and column potentials v). The solutions of
+    up to MATCHING_CACHE_SIZE box configurations are cached, each as a single
+    tuple of ints; when the cache is full the older half of it is dropped.
+    A configuration that differs from a cached one
+    by a single box is solved from it by freeing the row of that box and
+    augmenting it again, which takes O(n^2) instead of O(n^3).
+    '''
+    def __init__(self, distances: np.ndarray):
+        self.columns: [[int]] = distances.tolist()
+        # boxes -> rows + u + v + p + (cost,), rows[i] being the cell of the box of row i
+        # and p[j] the row matched to column j; rows and columns start at 1
+        self.cache: dict = {}
+
+    def __call__(self, boxes: int, parent_boxes: int = None) -> int:
+        solution = self.cache.get(boxes)
+        if solution is None:
+            parent_solution = self.cache.get(parent_boxes)
+            moved: int = boxes ^ parent_boxes if parent_solution else 0
+            if parent_solution and bin(moved).count('1') == 2:
+                solution = self.repair(parent_solution, lowest_bit(moved & parent_boxes), lowest_bit(moved & boxes))
+            else:
+                solution = self.solve(boxes)
+            if len(self.cache) >= MATCHING_CACHE_SIZE:
+                for key in list(itertools.islice(self.cache, MATCHING_CACHE_SIZE // 2)):
+                    del self.cache[key]
+            self.cache[boxes] = solution
+        return solution[-1]
+
+    def solve(self, boxes: int):
+        rows: [int] = [-1] + list(iter_bits(boxes))
+        n: int = len(self.columns)
+        u: [int] = [0] * (n + 1)
+        v: [int] = [0] * (n + 1)
+        p: [int] = [0] * (n + 1)
+        for row in range(1, n + 1):
+            self.augment(row, rows, u, v, p)
+        return tuple(rows + u + v + p) + (self.cost(rows, p),)
+
+    def repair(self, solution, box_old: int, box_new: int):
+        size: int = len(self.columns) + 1
+        rows, u, v, p = [list(solution[start:start + size]) for start in range(0, 4 * size, size)]
+        row: int = rows.index(box_old)
+        rows[row] = box_new
+        p[p.index(row, 1)] = 0 # free the column of the moved box
+        u[row] = 0 # all the reduced costs of the row are non-negative, as v <= 0
+        self.augment(row, rows, u, v, p)
+        return tuple(rows + u + v + p) + (self.cost(rows, p),)
+
+    def augment(self, row: int, rows: [int], u: [int], v: [int], p: [int]):
+        '''
+        Match the free 'row' along a shortest augmenting path, updating the
+        potentials so that every matched pair keeps a zero reduced cost.
+        '''
+        columns: [[int]] = self.columns
+        n: int = len(columns)
+        minv: [float] = [math.inf] * (n + 1)
+        way: [int] = [0] * (n + 1)
+        used: [bool] = [False] * (n + 1)
+        p[0] = row
+        j0: int = 0
+        while True:
+            used[j0] = True
+            i0: int = p[j0]
+            box: int = rows[i0]
+            delta: float = math.inf
+            j1: int = 0
+            for j in range(1, n + 1):
+                if not used[j]:
+                    current: int = columns[j - 1][box] - u[i0] - v[j]
+                    if current < minv[j]:
+                        minv[j] = current
+                        way[j] = j0
+                    if minv[j] < delta:
+                        delta = minv[j]
+                        j1 = j
+            for j in range(n + 1):
+                if used[j]:
+                    u[p[j]] += delta
+                    v[j] -= delta
+                else:
+                    minv[j] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+
+    def cost(self, rows: [int], p: [int]) -> int:
+        return sum(self.columns[j - 1][rows[p[j]]] for j in range(1, len(p)))
+
+
+class DeadlockDetector(object):
+    '''
+    Pruning stage that looks at the neighbourhood of a box just pushed and
+    tells whether the new box configuration is a deadlock. Calling the
+    detector with (boxes, box) runs its rules in order and stops at the first
+    one that finds a deadlock. Each rule is a pair (name, function) where the
+    function takes the same two arguments, and the number of configurations
+    pruned by each rule is counted in 'counters'.
+
+    The default rules are
+     two_by_two: the box closes a 2x2 square of walls and boxes, and one of
+                 these boxes is not on a target.
+     frozen: the box can move along neither axis, being blocked by walls,
+             by taboo cells on both sides or by other frozen boxes, and one
+             of the frozen boxes is not on a target.
+    '''
+    def __init__(self, index: WarehouseIndex, rules=None):
+        self.horizontal: (int, int) = (DIRECTION_INDEX['Left'], DIRECTION_INDEX['Right'])
+        self.vertical: (int, int) = (DIRECTION_INDEX['Up'], DIRECTION_INDEX['Down'])
+        self.neighbours: [(int, int, int, int)] = index.neighbours
+        self.target_mask: int = index.target_mask
+        self.taboo_mask: int = index.taboo_mask
+        self.rules: [(str, object)] = rules if rules is not None else [('two_by_two', self.two_by_two),
+                                                                       ('frozen', self.frozen)]
+        self.counters: dict = {name: 0 for name, _ in self.rules}
+
+        # The three other cells (-1 for a wall) of the four 2x2 squares containing each cell
+        self.squares: [[(int, int, int)]] = []
+        for x, y in index.cells:
+            cell_squares: [(int, int, int)] = []
+            for dx in (-1, 1):
+                for dy in (-1, 1):
+                    square: [(int, int)] = [(x + dx, y), (x, y + dy), (x + dx, y + dy)]
+                    cell_squares.append(tuple(index.cell_index.get(pos, -1) for pos in square))
+            self.squares.append(cell_squares)
+
+    def __call__(self, boxes: int, box: int) -> bool:
+        for name, rule in self.rules:
+            if rule(boxes, box):
+                self.counters[name] += 1
+                return True
+        return False
+
+    def two_by_two(self, boxes: int, box: int) -> bool:
+        for square in self.squares[box]:
+            square_boxes: int = 1 << box
+            for cell in square:
+                if cell >= 0:
+                    if not boxes >> cell & 1:
+                        break
+                    square_boxes |= 1 << cell
+            else:
+                if square_boxes & ~self.target_mask:
+                    return True
+        return False
+
+    def frozen(self, boxes: int, box: int) -> bool:
+        frozen_boxes: [int] = [box]
+        if self.is_blocked(box, self.horizontal, boxes, 0, frozen_boxes) and \
+                self.is_blocked(box, self.vertical, boxes, 0, frozen_boxes):
+            return any(not self.target_mask >> frozen_box & 1 for frozen_box in frozen_boxes)
+        return False
+
+    def is_blocked(self, box: int, axis: (int, int), boxes: int, fixed: int, frozen_boxes: [int]) -> bool:
+        '''
+        Return True if the box cannot be pushed along 'axis'. The boxes in the
+        bitmask 'fixed' are treated as walls, which stops the recursion through
+        boxes that block each other. Blocking boxes are added to 'frozen_boxes'.
+        '''
+        before, after = self.neighbours[box][axis[0]], self.neighbours[box][axis[1]]
+        if before < 0 or after < 0 or (fixed >> before & 1) or (fixed >> after & 1):
+            return True
+        if self.taboo_mask >> before & 1 and self.taboo_mask >> after & 1:
+            return True
+
+        fixed |= 1 << box
+        other_axis: (int, int) = self.vertical if axis == self.horizontal else self.horizontal
+        for side in (before, after):
+            if boxes >> side & 1 and self.is_blocked(side, other_axis, boxes, fixed, frozen_boxes):
+                frozen_boxes.append(side)
+                return True
+        return False
+
+
 class SokobanPuzzle(search.Problem):
     '''
     An instance of the class 'SokobanPuzzle' represents a Sokoban puzzle.
@@ -258,21 +702,91 @@ class SokobanPuzzle(search.Problem):
     macro actions. If self.macro is set False, the 'actions' function should 
     return elementary actions.
     
+    The attribute self.cost selects what a macro action costs:
+    - 'pushes': one per push, the walk of the worker is free
+    - 'moves': the moves of the walk to the box plus the push
+    - 'pushes_moves': pushes first and moves second, a push costs PUSH_COST
+      on top of its moves
+    In the last two modes the worker keeps its cell in the state, since the
+    cost of the next push depends on it.
     
     '''
-    def __init__(self, warehouse, allow_taboo_push=False, macro=False):
+    def __init__(self, warehouse, allow_taboo_push=False, macro=False, corral_pruning=True, cost='pushes'):
+        if cost not in MACRO_COSTS:
+            raise ValueError(f"Unknown cost: {cost}")
         self.warehouse: sokoban.Warehouse = warehouse
         self.allow_taboo_push: bool = allow_taboo_push
         self.macro: bool = macro
-
+        self.cost: str = cost
+        # macro states only keep the region of the worker when walking is free
+        self.normalise: bool = macro and cost == 'pushes'
+
+        # States are encoded as (worker, boxes) where the worker is the index of
+        # its floor cell and boxes is a bitboard with bit i set for a box on cell i
+        self.index: WarehouseIndex = get_warehouse_index(warehouse)
+        self.cells: [(int, int)] = self.index.cells
+        self.cell_index: dict = self.index.cell_index
+        self.neighbours: [(int, int, int, int)] = self.index.neighbours
+        self.target_mask: int = self.index.target_mask
+
+        # Pushes onto taboo cells and pushes that freeze boxes are pruned,
+        # unless taboo pushes are allowed
         if allow_taboo_push:
-            self.taboo_cells_set: set[(int, int)] = set()
+            self.taboo_mask: int = 0
+            self.deadlock_detector: DeadlockDetector = None
         else:
-            self.taboo_cells_set: set[(int, int)] = set(getTabooCellsList(warehouse.walls, warehouse.targets))
-
-        initial: ((int, int), ((int, int))) = tuple(warehouse.worker), tuple(warehouse.boxes)
+            self.taboo_mask: int = self.index.taboo_mask
+            self.deadlock_detector: DeadlockDetector = DeadlockDetector(self.index)
+
+        # PI-corral pruning of macro pushes, see pi_corral_pushes. Postponing
+        # the other pushes keeps the number of pushes but not of moves, so it
+        # is only used when walking is free.
+        self.corral_pruning: bool = corral_pruning and self.normalise and not allow_taboo_push
+        self.corral_counters: dict = {'restricted': 0, 'deadlock': 0}
+        # cells the worker could ever walk on, that is its region when ignoring the boxes
+        self.interior: int = get_reachable_cells(self.cell_index[tuple(warehouse.worker)], 0, self.neighbours)
+
+        self.last_moves: (object, dict) = (None, {})
+        self.matching: BoxTargetMatching = BoxTargetMatching(self.index.push_distances)
+
+        initial: (int, int) = self.encode_state(warehouse.worker, warehouse.boxes)
+        if self.normalise:
+            initial = self.normalise_state(initial)
         super().__init__(initial)
 
+    def encode_state(self, worker_pos: (int, int), boxes: [(int, int)]) -> (int, int):
+        return self.cell_index[tuple(worker_pos)], encode_cells(boxes, self.cell_index)
+
+    def normalise_state(self, state) -> (int, int):
+        '''
+        Move the worker to the smallest cell index of the region it can reach.
+        Macro actions only depend on that region, so states with the same boxes
+        and the worker anywhere in the same region share one key.
+        '''
+        worker, boxes = state
+        reachable: int = self.index.reachable_region(worker, boxes)
+        return lowest_bit(reachable), boxes
+
+    def pack_state(self, state) -> int:
+        '''
+        Pack a state into a single integer: the boxes bitboard above the
+        bits of the worker cell.
+        '''
+        worker, boxes = state
+        return boxes << self.worker_bits | worker
+
+    @functools.cached_property
+    def worker_bits(self) -> int:
+        return len(self.cells).bit_length()
+
+    def explored_set(self, capacity: int = 1 << 16) -> search.PackedStateSet:
+        '''
+        Return an empty search.PackedStateSet of the states of this puzzle,
+        to pass as the 'explored' argument of the graph searches. A state
+        takes a key of len(cells) + worker_bits bits.
+        '''
+        return search.PackedStateSet(self.pack_state, len(self.cells) + self.worker_bits, capacity)
+
     def actions(self, state):
         """
         Return the list of actions that can be executed in the given state.
@@ -281,88 +795,273 @@ class SokobanPuzzle(search.Problem):
         'self.allow_taboo_push' and 'self.macro' should be tested to determine
         what type of list of actions is to be returned.
         """
-        worker_pos, boxes = state
+        if not self.macro:
+            # Elementary actions
+            return list(self.elementary_moves(state))
+        else:
+            # Macro actions
+            return [action for action, _, _ in self.macro_pushes(state)]
 
+    def successors(self, state):
+        '''
+        Return the (action, next_state, step_cost) triples of 'state' in one
+        pass, see search.Problem. Only the legal, non-taboo moves are generated.
+        '''
         if not self.macro:
             # Elementary actions
-            available_actions: [str] = []
-            for action in movements.keys():
-                result = check_action(worker_pos, list(boxes), self.warehouse.walls, action)
-                if result != 'Failure':
-                    _, boxes_new = result
-                    if not self.taboo_cells_set.intersection(boxes_new):
-                        available_actions.append(action)
-            return available_actions
+            return [(action, state_new, 1) for action, state_new in self.elementary_moves(state).items()]
         else:
             # Macro actions
-            walls: set[(int, int)] = set(self.warehouse.walls)
-            boxes: set[(int, int)] = set(boxes)
-            obstacles: set[(int, int)] = walls.union(boxes)
-
-            available_actions: [((int, int), str)] = []
-            reachable_positions: set[(int, int)] = get_reachable_positions(worker_pos, obstacles)
-
-            for box_pos in boxes:
-                for action, (dx, dy) in movements.items():
-                    box_push_pos: (int, int) = (box_pos[0] - dx, box_pos[1] - dy)
-                    box_new_pos: (int, int) = (box_pos[0] + dx, box_pos[1] + dy)
-                    if box_new_pos in obstacles:
-                        continue
-                    if box_new_pos in self.taboo_cells_set:
+            # the regions after the pushes are updated from the region before them
+            worker, boxes = state
+            reachable: int = self.index.reachable_region(worker, boxes)
+            successors: [(((int, int), str), (int, int), int)] = []
+            for action, box, boxes_new in self.macro_pushes(state):
+                region_new: int = self.index.push_region(reachable, boxes_new, box, self.neighbours[box][DIRECTION_INDEX[action[1]]])
+                if self.normalise:
+                    successors.append((action, (lowest_bit(region_new), boxes_new), 1))
+                else:
+                    successors.append((action, (box, boxes_new), self.push_cost(state, box, action[1])))
+            return successors
+
+    def push_cost(self, state, box: int, direction: str) -> int:
+        '''
+        Return the cost of the macro action pushing the box on cell 'box' in
+        'direction' from 'state', see self.cost.
+        '''
+        if self.cost == 'pushes':
+            return 1
+        worker, boxes = state
+        box_push: int = self.neighbours[box][OPPOSITE[DIRECTION_INDEX[direction]]]
+        moves: int = self.index.worker_distances(worker, boxes)[box_push] + 1
+        return moves + PUSH_COST if self.cost == 'pushes_moves' else moves
+
+    def path_cost(self, c, state1, action, state2):
+        if not self.macro:
+            return c + 1
+        box, direction = action
+        return c + self.push_cost(state1, self.cell_index[(box[1], box[0])], direction)
+
+    def macro_pushes(self, state) -> [(((int, int), str), int, int)]:
+        '''
+        Return a triple (action, box, boxes_new) for each box push the worker
+        can reach in 'state', where 'box' is the cell of the pushed box and
+        'boxes_new' the bitboard after the push. The reachable region is
+        computed once for all the boxes.
+        '''
+        worker, boxes = state
+        neighbours: [(int, int, int, int)] = self.neighbours
+        blocked: int = boxes | self.taboo_mask
+        reachable: int = self.index.reachable_region(worker, boxes)
+
+        pushes: [(((int, int), str), int, int)] = []
+        for box in iter_bits(boxes):
+            box_x, box_y = self.cells[box]
+            for direction, action in enumerate(movements):
+                box_push: int = neighbours[box][OPPOSITE[direction]]
+                box_new: int = neighbours[box][direction]
+                if box_new < 0 or blocked >> box_new & 1:
+                    continue
+                if box_push >= 0 and reachable >> box_push & 1:
+                    boxes_new: int = boxes ^ (1 << box) ^ (1 << box_new)
+                    if self.deadlock_detector and self.deadlock_detector(boxes_new, box_new):
                         continue
-                    if box_push_pos in reachable_positions:
-                        box: (int, int) = (box_pos[1], box_pos[0])  # answer require box=(row, column)
-                        available_actions.append((box, action))
-            return available_actions
+                    pushes.append((((box_y, box_x), action), box, boxes_new))  # answer require box=(row, column)
+
+        if self.corral_pruning:
+            return self.pi_corral_pushes(boxes, reachable, pushes)
+        return pushes
+
+    def pi_corral_pushes(self, boxes: int, reachable: int, pushes: [(((int, int), str), int, int)]):
+        '''
+        Restrict 'pushes' to the boundary boxes of a PI-corral, if there is one.
+
+        A corral is a connected area of the cells the worker cannot reach,
+        including the boxes in it. Its boundary boxes are those next to the
+        worker's region. It is unsolved if its boxes do not exactly cover its
+        targets. It is a PI-corral when, from any cell outside of it, every
+        push of a boundary box goes into the corral (I), and the worker can
+        already reach every cell these pushes start from (P).
+        An unsolved corral can only be changed by pushing a boundary box into
+        it. Pushes made elsewhere first can be postponed until after that
+        push, so the pushes of the PI-corral with the fewest pushes are
+        enough. If such a corral has no legal push, the state is a deadlock.
+        '''
+        neighbours: [(int, int, int, int)] = self.neighbours
+        best_pushes: [(((int, int), str), int, int)] = None
+        unreachable: int = self.interior & ~reachable
+        while unreachable:
+            corral: int = get_connected_cells(lowest_bit(unreachable), unreachable, neighbours)
+            unreachable &= ~corral
+            if corral & boxes == corral & self.target_mask:
+                continue
+
+            boundary: int = 0
+            is_pi_corral: bool = True
+            for box in iter_bits(corral & boxes):
+                if not any(cell >= 0 and reachable >> cell & 1 for cell in neighbours[box]):
+                    continue
+                boundary |= 1 << box
+                for direction in range(len(movements)):
+                    box_push: int = neighbours[box][OPPOSITE[direction]]
+                    box_new: int = neighbours[box][direction]
+                    if box_push < 0 or corral >> box_push & 1:
+                        continue # the worker cannot stand there from outside
+                    if box_new < 0 or self.taboo_mask >> box_new & 1:
+                        continue # the box can never be pushed this way
+                    if not corral >> box_new & 1 or not reachable >> box_push & 1:
+                        is_pi_corral = False
+                        break
+                if not is_pi_corral:
+                    break
+            if not is_pi_corral:
+                continue
+
+            corral_pushes = [push for push in pushes if boundary >> push[1] & 1]
+            if best_pushes is None or len(corral_pushes) < len(best_pushes):
+                best_pushes = corral_pushes
+                if not best_pushes:
+                    break
+
+        if best_pushes is None:
+            return pushes
+        self.corral_counters['deadlock' if not best_pushes else 'restricted'] += 1
+        return best_pushes
+
+    def elementary_moves(self, state) -> dict:
+        '''
+        Return a dict mapping each elementary action allowed in 'state' to the
+        state it leads to, generated in a single pass over the four directions.
+        The moves of the last state are kept, so that the calls to 'result'
+        following a call to 'actions' on the same state are lookups.
+        '''
+        if self.last_moves[0] == state:
+            return self.last_moves[1]
+
+        worker, boxes = state
+        neighbours: [(int, int, int, int)] = self.neighbours
+        blocked: int = boxes | self.taboo_mask
+        moves: dict = {}
+        for direction, action in enumerate(movements):
+            worker_new: int = neighbours[worker][direction]
+            if worker_new < 0:
+                continue
+            boxes_new: int = boxes
+            if boxes >> worker_new & 1:
+                box_new: int = neighbours[worker_new][direction]
+                if box_new < 0 or blocked >> box_new & 1:
+                    continue
+                boxes_new = boxes ^ (1 << worker_new) ^ (1 << box_new)
+                if self.deadlock_detector and self.deadlock_detector(boxes_new, box_new):
+                    continue
+            moves[action] = (worker_new, boxes_new)
+
+        self.last_moves = (state, moves)
+        return moves
 
     def result(self, state, action):
-        worker_pos, boxes = state
+        worker, boxes = state
 
         if not self.macro:
             # Elementary actions
-            result = check_action(worker_pos, list(boxes), self.warehouse.walls, action)
-            if result == 'Failure':
+            state_new = self.elementary_moves(state).get(action)
+            if state_new is not None:
+                return state_new
+            # a legal push onto a taboo cell is not among the generated moves
+            direction: int = DIRECTION_INDEX[action]
+            worker_new: int = self.neighbours[worker][direction]
+            if worker_new < 0:
                 return state
-            else:
-                worker_pos_new, boxes_new = result
-                return tuple(worker_pos_new), tuple(boxes_new)
+            if boxes >> worker_new & 1:
+                box_new: int = self.neighbours[worker_new][direction]
+                if box_new < 0 or boxes >> box_new & 1:
+                    return state
+                boxes ^= (1 << worker_new) | (1 << box_new)
+            return worker_new, boxes
         else:
             # Macro actions
-            boxes: set[(int, int)] = set(boxes)
-
             box, direction = action
-            box_pos: (int, int) = (box[1], box[0])  # answer require box=(row, column)
-            dx, dy = movements[direction]
-
-            worker_pos_new: (int, int) = (box_pos[0] - dx, box_pos[1] - dy)
-            box_new_pos: (int, int) = (box_pos[0] + dx, box_pos[1] + dy)
-
-            boxes_new: set[(int, int)] = boxes.copy()
-            boxes_new.remove(box_pos)
-            boxes_new.add(box_new_pos)
-
-            return tuple(worker_pos_new), tuple(boxes_new)
+            box_cell: int = self.cell_index[(box[1], box[0])]  # answer require box=(row, column)
+            box_new: int = self.neighbours[box_cell][DIRECTION_INDEX[direction]]
+            state_new: (int, int) = (box_cell, boxes ^ (1 << box_cell) ^ (1 << box_new))
+            return self.normalise_state(state_new) if self.normalise else state_new
 
     def goal_test(self, state) -> bool:
-        worker_pos, boxes = state
-        targets: [(int, int)] = self.warehouse.targets
-        return set(boxes) == set(targets)
+        worker, boxes = state
+        return boxes == self.target_mask
+
+    def goal_states(self) -> [(int, int)]:
+        '''
+        Return the goal states of the backward search: the boxes on the
+        targets and the worker in any region next to a box, where the last
+        push can have left it. Only macro states counting pushes are supported,
+        other puzzles raise a ValueError.
+        '''
+        if not self.normalise:
+            raise ValueError("backward search needs macro actions counting pushes")
+        boxes: int = self.target_mask
+        next_to_boxes: int = 0
+        for box in iter_bits(boxes):
+            for cell in self.neighbours[box]:
+                if cell >= 0:
+                    next_to_boxes |= 1 << cell
+
+        states: [(int, int)] = []
+        free: int = self.interior & ~boxes
+        while free:
+            region: int = get_connected_cells(lowest_bit(free), free, self.neighbours)
+            free &= ~region
+            if region & next_to_boxes:
+                states.append((lowest_bit(region), boxes))
+        return states
+
+    def predecessors(self, state) -> [(((int, int), str), (int, int))]:
+        '''
+        Return the (action, previous_state) pairs of the pulls from 'state':
+        the worker steps back from a box next to it and drags the box along,
+        which undoes the push 'action' made in 'previous_state'.
+        '''
+        if not self.normalise:
+            raise ValueError("backward search needs macro actions counting pushes")
+        worker, boxes = state
+        neighbours: [(int, int, int, int)] = self.neighbours
+        reachable: int = self.index.reachable_region(worker, boxes)
+
+        pulls: [(((int, int), str), (int, int))] = []
+        for box in iter_bits(boxes):
+            for direction, action in enumerate(movements):
+                # the box was pushed in 'direction' from box_prev, where the worker stands
+                box_prev: int = neighbours[box][OPPOSITE[direction]]
+                if box_prev < 0 or not reachable >> box_prev & 1:
+                    continue
+                worker_prev: int = neighbours[box_prev][OPPOSITE[direction]]
+                if worker_prev < 0 or boxes >> worker_prev & 1:
+                    continue
+                boxes_prev: int = boxes ^ (1 << box) ^ (1 << box_prev)
+                box_x, box_y = self.cells[box_prev]
+                region_prev: int = self.index.reachable_region(worker_prev, boxes_prev)
+                pulls.append((((box_y, box_x), action), (lowest_bit(region_prev), boxes_prev)))  # answer require box=(row, column)
+        return pulls
 
     def h(self, node):
-        worker_pos, boxes = node.state
-        boxes: set[(int, int)] = set(boxes)
-        targets: set[(int, int)] = set(self.warehouse.targets)
-        boxes_on_targets: set[(int, int)] = targets.intersection(boxes)
-        remaining_boxes: [(int, int)] = list(boxes.difference(boxes_on_targets))
-        remaining_targets: [(int, int)] = list(targets.difference(boxes_on_targets))
-
-        total_distance: int = 0
-        # Random assign boxes to targets
-        for index in range(len(remaining_boxes)):
-            total_distance += manhattan_distance(remaining_boxes[index], remaining_targets[index])
-
-        worker_to_box_distance: int = min([manhattan_distance(worker_pos, box) for box in boxes])
-        return total_distance * 3 + worker_to_box_distance * 2
+        '''
+        Admissible and consistent estimate of the cost left from 'node'.
+        The number of pushes left is at least the cost of the best matching of
+        the boxes to the targets. When moves are counted, each push is a move
+        and the worker must also walk next to a box before its next push, at
+        least the Manhattan distance to the nearest box minus one.
+        '''
+        worker, boxes = node.state
+        parent_boxes: int = node.parent.state[1] if node.parent else None
+        pushes: int = self.matching(boxes, parent_boxes)
+        if self.normalise or pushes == 0:
+            return pushes
+
+        cells: [(int, int)] = self.cells
+        worker_pos: (int, int) = cells[worker]
+        worker_to_box_distance: int = min([manhattan_distance(worker_pos, cells[box]) for box in iter_bits(boxes)])
+        moves: int = pushes + worker_to_box_distance - 1
+        return pushes * PUSH_COST + moves if self.macro and self.cost == 'pushes_moves' else moves
 
 
 movements = {
@@ -371,6 +1070,139 @@ movements = {
     'Left': (-1, 0),
     'Right': (1, 0)
 }
+MACRO_COSTS = ('pushes', 'moves', 'pushes_moves')
+PUSH_COST = 1 << 32  # larger than the moves of any plan, so pushes are minimised first
+DIRECTION_INDEX = {action: direction for direction, action in enumerate(movements)}
+OPPOSITE = [DIRECTION_INDEX['Down'], DIRECTION_INDEX['Up'], DIRECTION_INDEX['Right'], DIRECTION_INDEX['Left']]
+
+def get_floor_cells(walls: set[(int, int)], num_of_row: int, num_of_col: int) -> ([(int, int)], dict):
+    '''
+    Number the non-wall cells of a warehouse with 'num_of_row' rows and
+    'num_of_col' columns in row-major order.
+
+    @return
+        cells: list of (x, y) positions, cells[i] is the position of cell i
+        cell_index: dict mapping an (x, y) position to its cell index
+    '''
+    cells: [(int, int)] = [(x, y) for y in range(num_of_row) for x in range(num_of_col) if (x, y) not in walls]
+    cell_index: dict = {pos: index for index, pos in enumerate(cells)}
+    return cells, cell_index
+
+def get_neighbour_table(cells: [(int, int)], cell_index: dict) -> [(int, int, int, int)]:
+    '''
+    Return for each cell the index of its neighbour in every direction of
+    'movements' (same order), or -1 if that neighbour is not a floor cell.
+    '''
+    return [tuple(cell_index.get((x + dx, y + dy), -1) for dx, dy in movements.values()) for x, y in cells]
+
+def encode_cells(positions: [(int, int)], cell_index: dict) -> int:
+    '''
+    Return the bitmask of the given positions, ignoring those outside the floor.
+    '''
+    mask: int = 0
+    for pos in positions:
+        pos = tuple(pos)
+        if pos in cell_index:
+            mask |= 1 << cell_index[pos]
+    return mask
+
+def lowest_bit(mask: int) -> int:
+    return (mask & -mask).bit_length() - 1
+
+def iter_bits(mask: int):
+    '''
+    Yield the index of each set bit of 'mask', lowest first.
+    '''
+    while mask:
+        low_bit: int = mask & -mask
+        yield low_bit.bit_length() - 1
+        mask ^= low_bit
+
+def get_push_distances(target: int, neighbours: [(int, int, int, int)]) -> [int]:
+    '''
+    Return the minimum number of pushes to move a lone box from every cell to
+    the cell 'target', or len(neighbours) if it cannot get there. A box can be
+    pushed from a cell to a neighbour if the cell behind it is also a floor
+    cell, so the search pulls the box back from the target.
+    '''
+    distances: [int] = [len(neighbours)] * len(neighbours)
+    distances[target] = 0
+    frontier = deque([target])
+    while frontier:
+        box: int = frontier.popleft()
+        for direction in range(len(movements)):
+            # pull the box one cell in 'direction', the worker backing away in front of it
+            box_prev: int = neighbours[box][direction]
+            if box_prev < 0 or neighbours[box_prev][direction] < 0:
+                continue
+            if distances[box_prev] <= distances[box] + 1:
+                continue
+            distances[box_prev] = distances[box] + 1
+            frontier.append(box_prev)
+    return distances
+
+def get_reachable_cells(start: int, boxes: int, neighbours: [(int, int, int, int)]) -> int:
+    '''
+    Return the bitmask of the cells the worker can walk to from the cell
+    'start' without pushing any of the boxes in the bitboard 'boxes'.
+    '''
+    # flat occupancy array, 1 for a box or an already visited cell
+    occupied: bytearray = bytearray(len(neighbours))
+    for box in iter_bits(boxes):
+        occupied[box] = 1
+    occupied[start] = 1
+    frontier: [int] = [start]
+    reachable_cells: [int] = [start]
+    while frontier:
+        current: int = frontier.pop()
+        for next_cell in neighbours[current]:
+            if next_cell >= 0 and not occupied[next_cell]:
+                occupied[next_cell] = 1
+                frontier.append(next_cell)
+                reachable_cells.append(next_cell)
+
+    reachable: int = 0
+    for cell in reachable_cells:
+        reachable |= 1 << cell
+    return reachable
+
+def get_connected_cells(start: int, area: int, neighbours: [(int, int, int, int)]) -> int:
+    '''
+    Return the bitmask of the cells of the bitmask 'area' connected to the
+    cell 'start' without leaving the area.
+    '''
+    connected: int = 1 << start
+    frontier: [int] = [start]
+    while frontier:
+        current: int = frontier.pop()
+        for next_cell in neighbours[current]:
+            if next_cell >= 0 and area >> next_cell & 1 and not connected >> next_cell & 1:
+                connected |= 1 << next_cell
+                frontier.append(next_cell)
+    return connected
+
+def get_worker_distances(start: int, boxes: int, neighbours: [(int, int, int, int)]) -> [int]:
+    '''
+    Return the number of moves from the cell 'start' to every cell without
+    pushing any of the boxes in the bitboard 'boxes', or -1 if the worker
+    cannot get there.
+    '''
+    distances: [int] = [-1] * len(neighbours)
+    for box in iter_bits(boxes):
+        distances[box] = -2  # blocked, reset to -1 below
+    distances[start] = 0
+    frontier: deque = deque([start])
+    while frontier:
+        current: int = frontier.popleft()
+        distance: int = distances[current] + 1
+        for next_cell in neighbours[current]:
+            if next_cell >= 0 and distances[next_cell] == -1:
+                distances[next_cell] = distance
+                frontier.append(next_cell)
+
+    for box in iter_bits(boxes):
+        distances[box] = -1
+    return distances
 
 def manhattan_distance(pos1, pos2) -> int:
     return abs(pos1[0] - pos2[0]) + abs(pos1[1] - pos2[1])
@@ -396,26 +1228,7 @@ def compute_min_distance(start: (int, int), goal: (int, int), walls: [(int, int)
             explored.add(next_pos)
     return None  # Goal is unreachable
 
-def get_reachable_positions(start_pos: (int, int), obstacles: set[(int, int)]) -> set[(int, int)]:
-    frontier = deque()
-    frontier.append(start_pos)
-    explored: set[(int, int)] = set()
-    explored.add(start_pos)
-    reachable_positions: set[(int, int)] = set()
-
-    while frontier:
-        current: (int, int) = frontier.popleft()
-        reachable_positions.add(current)
-        for dx, dy in movements.values():
-            next_pos: (int, int) = (current[0] + dx, current[1] + dy)
-            if next_pos in obstacles or next_pos in explored:
-                continue
-            frontier.append(next_pos)
-            explored.add(next_pos)
-    return reachable_positions
-
-def check_action(worker_pos: (int, int), boxes: [(int, int)], walls: [(int, int)], action: str):
-    boxes: [(int, int)] = boxes[:]
+def check_action(worker_pos: (int, int), boxes: set[(int, int)], walls: set[(int, int)], action: str):
     dx, dy = movements[action]
     worker_pos_new: (int, int) = (worker_pos[0] + dx, worker_pos[1] + dy)
 
@@ -434,8 +1247,9 @@ def check_action(worker_pos: (int, int), boxes: [(int, int)], walls: [(int, int)
         if behind_pos in boxes:
             return 'Failure'
 
+        boxes = set(boxes)
         boxes.remove(worker_pos_new)
-        boxes.append(behind_pos)
+        boxes.add(behind_pos)
 
     return worker_pos_new, boxes
 
@@ -464,8 +1278,8 @@ def check_action_seq(warehouse, action_seq):
                string returned by the method  Warehouse.__str__()
     '''
     worker_pos: (int, int) = warehouse.worker
-    boxes: [(int, int)] = warehouse.boxes[:]
-    walls: [(int, int)] = warehouse.walls[:]
+    boxes: set[(int, int)] = set(warehouse.boxes)
+    walls: set[(int, int)] = get_warehouse_index(warehouse).walls
 
     for action in action_seq:
         result = check_action(worker_pos, boxes, walls, action)
@@ -474,7 +1288,7 @@ def check_action_seq(warehouse, action_seq):
         else:
             worker_pos, boxes = result
 
-    warehouse_new: sokoban.Warehouse = warehouse.copy(worker_pos, boxes)
+    warehouse_new: sokoban.Warehouse = warehouse.copy(worker_pos, list(boxes))
     return warehouse_new.__str__()
 
 
@@ -516,11 +1330,11 @@ def solve_sokoban_elem(warehouse):
 class WorkerPathProblem(search.Problem):
     def __init__(self, warehouse, goal):
         super().__init__(warehouse.worker, goal)
-        walls: set[(int, int)] = set(warehouse.walls)
+        walls: set[(int, int)] = get_warehouse_index(warehouse).walls
         boxes: set[(int, int)] = set(warehouse.boxes)
 
         self.warehouse: sokoban.Warehouse = warehouse
-        self.obstacles: [(int, int)] = list(walls.union(boxes))
+        self.obstacles: set[(int, int)] = walls.union(boxes)
 
     def actions(self, state):
         worker_x, worker_y = state
@@ -603,17 +1417,23 @@ def can_go_there(warehouse, dst, visualise=False):
       True if the worker can walk to cell dst=(row,column) without pushing any box
       False otherwise
     '''
-    solver = WorkerPathProblem(warehouse, (dst[1], dst[0]))
-    solution = search.breadth_first_graph_search(solver)
-    if solution:
-        if visualise:
-            solver.print_solution(solution)
-        return True
-    else:
+    index: WarehouseIndex = get_warehouse_index(warehouse)
+    dst_cell: int = index.cell_index.get((dst[1], dst[0]), -1)  # require dst=(row,column)
+    boxes: int = encode_cells(warehouse.boxes, index.cell_index)
+    if dst_cell < 0 or boxes >> dst_cell & 1:
+        return False  # a wall, a box or outside the warehouse
+
+    worker: int = index.cell_index[tuple(warehouse.worker)]
+    if not index.reachable_region(worker, boxes) >> dst_cell & 1:
         return False
 
+    if visualise:
+        solver = WorkerPathProblem(warehouse, (dst[1], dst[0]))
+        solver.print_solution(search.breadth_first_graph_search(solver))
+    return True
+
 
-def solve_sokoban_macro(warehouse):
+def solve_sokoban_macro(warehouse, cost='pushes'):
     '''    
     Solve using macro actions the puzzle defined in the warehouse passed as
     a parameter. A sequence of macro actions should be 
@@ -625,13 +1445,15 @@ def solve_sokoban_macro(warehouse):
     goes the box at row 12 and column 4 and pushes it down.
     
     @param warehouse: a valid Warehouse object
+    @param cost: what the solution minimises, 'pushes', 'moves' or
+        'pushes_moves' (pushes first, then moves), see SokobanPuzzle
 
     @return
         If puzzle cannot be solved return the string 'Impossible'
         Otherwise return M a sequence of macro actions that solves the puzzle.
         If the puzzle is already in a goal state, simply return []
     '''
-    solver = SokobanPuzzle(warehouse, macro=True)
+    solver = SokobanPuzzle(warehouse, macro=True, cost=cost)
     solution = search.astar_graph_search(solver)
 
     if solution:
@@ -639,3 +1461,55 @@ def solve_sokoban_macro(warehouse):
     else:
         return "Impossible"
 
+
+
+def expand_macro_solution(warehouse, macro_actions):
+    '''
+    Expand a sequence of macro actions, as returned by solve_sokoban_macro,
+    into the elementary actions the worker performs: the shortest walk to
+    each box followed by the push. Each action is checked with the same
+    rules as check_action_seq while the plan is built.
+
+    @param warehouse: a valid Warehouse object
+
+    @param macro_actions: a sequence of macro actions ((row, column), direction)
+
+    @return
+        The string 'Failure', if a box is missing, cannot be pushed in the
+            given direction, or the worker cannot walk behind it or stand
+            there.
+        Otherwise the list of elementary actions, for example
+            ['Left', 'Down', Down','Right', 'Up', 'Down']
+    '''
+    index: WarehouseIndex = get_warehouse_index(warehouse)
+    neighbours: [(int, int, int, int)] = index.neighbours
+    actions: [str] = list(movements)
+    worker, boxes = index.cell_index[tuple(warehouse.worker)], encode_cells(warehouse.boxes, index.cell_index)
+
+    elem_actions: [str] = []
+    for (row, column), action in macro_actions:
+        box: int = index.cell_index.get((column, row), -1)  # answer require box=(row, column)
+        direction: int = DIRECTION_INDEX.get(action, -1)
+        if box < 0 or direction < 0 or not boxes >> box & 1:
+            return 'Failure'
+        box_push: int = neighbours[box][OPPOSITE[direction]]
+        box_new: int = neighbours[box][direction]
+        if box_push < 0 or box_new < 0 or boxes >> box_new & 1 or boxes >> box_push & 1:
+            return 'Failure'
+
+        # walk down the distances to the cell behind the box
+        distances: [int] = index.worker_distances(box_push, boxes)
+        if distances[worker] < 0:
+            return 'Failure'
+        while worker != box_push:
+            for step, next_cell in enumerate(neighbours[worker]):
+                if next_cell >= 0 and distances[next_cell] == distances[worker] - 1:
+                    elem_actions.append(actions[step])
+                    worker = next_cell
+                    break
+            else:
+                return 'Failure'
+
+        elem_actions.append(action)
+        worker, boxes = box, boxes ^ (1 << box) ^ (1 << box_new)
+    return elem_actions
@@ -2,81 +2,239 @@ import time
 import glob
 import os
 import multiprocessing as mp
+import multiprocessing.pool
 import multiprocessing.queues as mpq
 import sokoban
 import search
 from typing import Tuple
 import csv
+import signal
+import hashlib
+import sqlite3
+import json
+import traceback
+import mySokobanSolver
 from mySokobanSolver import *
 
+# Methods compared by testAll and testAllParallel
+METHODS = [
+    {'macro': False, 'search_method': 'astar', 'name': 'elem_astar'},
+    {'macro': False, 'search_method': 'bfs', 'name': 'elem_bfs'},
+    {'macro': True, 'search_method': 'astar', 'name': 'macro_astar'},
+    {'macro': True, 'search_method': 'bfs', 'name': 'macro_bfs'},
+    {'macro': True, 'search_method': 'astar', 'corral_pruning': False, 'name': 'macro_astar_nocorral'},
+]
 
-def test_warehouse(problem_file, macro=False, search_method='astar', limit_of_boxes=6):
+
+def method_options(method) -> dict:
+    '''
+    Return the keyword arguments of the solver given by the entries of the
+    method dict 'method' other than 'macro', 'name' and 'search_method',
+    such as 'corral_pruning' for solve_sokoban_macro.
+    '''
+    return {key: value for key, value in method.items() if key not in ('macro', 'name', 'search_method')}
+
+
+# Pruning rules whose pruned states are counted in the reports, see record_pruning
+PRUNING_RULES = ['two_by_two', 'frozen', 'corral_restricted', 'corral_deadlock']
+
+# Search statistics written as columns of the reports, see search.SearchStats
+STATS_COLUMNS = list(search.SearchStats(timed=True).as_dict()) + ['pruned_' + name for name in PRUNING_RULES]
+
+RESULTS_DB = 'results.sqlite'
+
+
+def format_stats(stats) -> dict:
+    '''
+    Return the search statistics 'stats' as strings, the timers in seconds
+    with 3 decimals, or an empty string for every column if 'stats' is None
+    and for the timers of stats that were not timed.
+    '''
+    if stats is None:
+        return dict.fromkeys(STATS_COLUMNS, '')
+    formatted = {}
+    for column in STATS_COLUMNS:
+        value = stats.get(column)
+        formatted[column] = '' if value is None else f'{value:.3f}' if isinstance(value, float) else str(value)
+    return formatted
+
+
+def file_hash(path) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def solver_version() -> str:
+    '''
+    Return a hash of the solver sources, including this module, which
+    holds METHODS and the settings the solvers are run with. Results
+    stored by another version of the solver are stale and solved again.
+    '''
+    digest = hashlib.sha1()
+    for path in (sokoban.__file__, search.__file__, mySokobanSolver.__file__, __file__):
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+class ResultsStore(object):
+    '''
+    Durable store of the benchmark results, in an SQLite file. A result is
+    keyed by the hash of the warehouse file, the method, the solver version
+    and the timeout, and is committed as soon as it is added, so an
+    interrupted run loses nothing and a rerun only solves the jobs missing
+    for the current version of the solver.
+    Results are "Solution found", "Impossible" or "Timed out", stored with
+    the search statistics of the run as JSON. Timed runs are slower, so a
+    store made with timed=True keeps its results apart from the untimed ones.
+    '''
+    def __init__(self, path=RESULTS_DB, version=None, timed=False):
+        self.version = solver_version() if version is None else version
+        self.suffix = ' timed' if timed else ''  # appended to the method names
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS results ('
+            'warehouse_hash TEXT, method TEXT, version TEXT, timeout REAL, '
+            'warehouse TEXT, result TEXT, time REAL, steps INTEGER, stats TEXT, '
+            'PRIMARY KEY (warehouse_hash, method, version, timeout))')
+        columns = [row[1] for row in self.connection.execute('PRAGMA table_info(results)')]
+        if 'stats' not in columns:  # created before the statistics were stored
+            self.connection.execute('ALTER TABLE results ADD COLUMN stats TEXT')
+        self.connection.commit()
+
+    def get(self, warehouse_hash, method_name, timeout):
+        '''
+        Return the stored (result, time_taken, num_steps, stats) of a job, or None.
+        '''
+        row = self.connection.execute(
+            'SELECT result, time, steps, stats FROM results '
+            'WHERE warehouse_hash = ? AND method = ? AND version = ? AND timeout = ?',
+            (warehouse_hash, method_name + self.suffix, self.version, timeout)).fetchone()
+        if row is None:
+            return None
+        result, time_taken, num_steps, stats = row
+        return result, time_taken, num_steps, None if stats is None else json.loads(stats)
+
+    def put(self, warehouse_hash, warehouse_name, method_name, timeout, result, time_taken, num_steps, stats=None):
+        if result not in ("Impossible", "Timed out"):
+            result = "Solution found"
+        self.connection.execute(
+            'INSERT OR REPLACE INTO results '
+            '(warehouse_hash, method, version, timeout, warehouse, result, time, steps, stats) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (warehouse_hash, method_name + self.suffix, self.version, timeout, warehouse_name, result, time_taken,
+             num_steps,
+             None if stats is None else json.dumps(stats)))
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+
+def test_warehouse(problem_file, macro=False, search_method='astar', limit_of_boxes=6, memory_limit=None,
+                   timed=False, options=None):
     '''
     This function tests the performance of your warehouse using either macro or elem solutions
-    and returns the result, time taken, and number of steps.
+    and returns the result, time taken, number of steps and search statistics.
+    The result is "MemoryLimit" if the search needed more than 'memory_limit' bytes of resident memory,
+    counted from the start of the search. If 'timed' is True, the statistics include the time spent in
+    each phase of the search, see search.SearchStats. 'options' are more keyword arguments of the solver,
+    see method_options.
     '''
     wh = sokoban.Warehouse()
     try:
         wh.load_warehouse(problem_file)
     except Exception as e:
         print("An error occurred when loading the warehouse.")
-        return "Error", None, None
+        return "Error", None, None, None
 
     num_of_boxes = len(wh.boxes)
     if num_of_boxes > limit_of_boxes:
         print("Skip: number of boxes exceeds limit")
-        return "Skip", None, None
+        return "Skip", None, None, None
 
+    stats = search.SearchStats(timed=timed)
+    memory = search.MemoryBudget(max_rss=memory_limit)
+    options = options or {}
     start_time = time.time()
-    if macro:
-        student_answer, num_steps = solve_sokoban_macro(wh, search_method=search_method)
-    else:
-        student_answer, num_steps = solve_sokoban_elem(wh, search_method=search_method)
+    try:
+        if macro:
+            student_answer, num_steps = solve_sokoban_macro(wh, search_method=search_method, stats=stats,
+                                                            memory=memory, **options)
+        else:
+            student_answer, num_steps = solve_sokoban_elem(wh, search_method=search_method, stats=stats,
+                                                           memory=memory, **options)
+    except search.MemoryLimitExceeded:
+        print("Search stopped: memory limit exceeded")
+        student_answer, num_steps = "MemoryLimit", None
     time_taken = time.time() - start_time
+    memory.sample()
+    stats.peak_rss = memory.peak_rss
 
-    return student_answer, time_taken, num_steps
+    return student_answer, time_taken, num_steps, stats.as_dict()
 
 
 def warehouse_timeout(args: Tuple[object], q: mp.Queue):
-    # Do not alter this code.
-    result, time_taken, num_steps = test_warehouse(*args)
-    q.put((result, time_taken, num_steps))
+    # an exception raised by the solver gives the result "SolverError"
+    try:
+        result, time_taken, num_steps, stats = test_warehouse(*args)
+    except Exception as e:
+        print(f"The solver raised {type(e).__name__}")
+        traceback.print_exc()
+        result, time_taken, num_steps, stats = "SolverError", None, None, None
+    q.put((result, time_taken, num_steps, stats))
 
 
-def test_with_timeout(problem_file, macro=False, search_method='astar', timeout=180, limit_of_boxes=6):
+def test_with_timeout(problem_file, macro=False, search_method='astar', timeout=180, limit_of_boxes=6,
+                      memory_limit=None, timed=False, options=None):
     """
     This function tests on a warehouse with the ability to timeout after a specified number of seconds.
 
     Parameters:
     problem_file (str): directory of a warehouse
     macro (bool): indicates whether to use the macro solver. If false, will use the elem solver
-    search_method (str): 'astar' or 'bfs' indicating which search method to use
+    search_method (str): the search method to use, see run_search
     timeout (int): The number of seconds the solver can run without timing out.
     limit_of_boxes (int): The maximum number of boxes allowed.
+    memory_limit (int): The number of bytes of resident memory the solver can add, None for no limit.
+    timed (bool): whether to time each phase of the search, which slows it down.
+    options (dict): more keyword arguments of the solver, see method_options.
 
     Returns:
-    A tuple (result, time_taken, num_steps) where result is the solver solution or a string indicating the outcome,
-    time_taken is the time taken in seconds, and num_steps is the number of steps in the solution.
+    A tuple (result, time_taken, num_steps, stats) where result is the solver solution or a string indicating the outcome,
+    time_taken is the time taken in seconds, num_steps is the number of steps in the solution, and stats is
+    the dict of search statistics (see search.SearchStats) or None.
+    The result is "SolverError" if the solver raised an exception or its process died without answering,
+    killed by the OOM killer for instance, and "Timed out" only if it was still running after 'timeout' seconds.
     """
     q_worker = mp.Queue()
-    proc = mp.Process(target=warehouse_timeout, args=((problem_file, macro, search_method, limit_of_boxes), q_worker))
+    proc = mp.Process(target=warehouse_timeout,
+                      args=((problem_file, macro, search_method, limit_of_boxes, memory_limit, timed, options),
+                            q_worker))
     proc.start()
     try:
         res = q_worker.get(timeout=timeout)
-        result, time_taken, num_steps = res
+        result, time_taken, num_steps, stats = res
     except mpq.Empty:
-        proc.terminate()
-        result = "Timed out"
-        time_taken = None
-        num_steps = None
+        result, time_taken, num_steps, stats = "Timed out", None, None, None
+        if proc.exitcode is None:
+            proc.terminate()
+        elif proc.exitcode == 0:  # answered just as the time ran out
+            result, time_taken, num_steps, stats = q_worker.get()
+        else:
+            print(f"The solver stopped with exit code {proc.exitcode}")
+            result = "SolverError"
     finally:
         proc.join()
-    return result, time_taken, num_steps
+    return result, time_taken, num_steps, stats
 
 
-def testAll(number=-1, timeout=180, limit_of_boxes=6):
+def testAll(number=-1, timeout=180, limit_of_boxes=6, results_db=RESULTS_DB, memory_limit=None, timed=False):
     file_name = "*" if number == -1 else f"warehouse_{number:04}"
     all_warehouses = sorted(glob.glob('warehouses/' + file_name + '.txt'))
+    # the results already stored for this solver version are not solved again
+    # the phase timers of the statistics are only filled in if 'timed' is True
+    store = ResultsStore(results_db, timed=timed)
 
     # Prepare a list to store the results
     results = []
@@ -95,59 +253,39 @@ def testAll(number=-1, timeout=180, limit_of_boxes=6):
             if num_of_boxes > limit_of_boxes:
                 print("Skip: number of boxes exceeds limit")
                 # Record 'Skip' for all methods
-                result_row = {
-                    'Warehouse': warehouse_name,
-                    'elem_astar': 'Skip',
-                    'elem_bfs': 'Skip',
-                    'macro_astar': 'Skip',
-                    'macro_bfs': 'Skip',
-                    'elem_astar_time': '',
-                    'elem_bfs_time': '',
-                    'macro_astar_time': '',
-                    'macro_bfs_time': '',
-                    'elem_astar_steps': '',
-                    'elem_bfs_steps': '',
-                    'macro_astar_steps': '',
-                    'macro_bfs_steps': ''
-                }
+                result_row = {'Warehouse': warehouse_name}
+                for m in METHODS:
+                    result_row.update({m['name']: 'Skip', m['name'] + '_time': '', m['name'] + '_steps': ''})
                 results.append(result_row)
                 continue
         except Exception as e:
             print("An error occurred when loading the warehouse.")
             # Record 'Error' for all methods
-            result_row = {
-                'Warehouse': warehouse_name,
-                'elem_astar': 'Error',
-                'elem_bfs': 'Error',
-                'macro_astar': 'Error',
-                'macro_bfs': 'Error',
-                'elem_astar_time': '',
-                'elem_bfs_time': '',
-                'macro_astar_time': '',
-                'macro_bfs_time': '',
-                'elem_astar_steps': '',
-                'elem_bfs_steps': '',
-                'macro_astar_steps': '',
-                'macro_bfs_steps': ''
-            }
+            result_row = {'Warehouse': warehouse_name}
+            for m in METHODS:
+                result_row.update({m['name']: 'Error', m['name'] + '_time': '', m['name'] + '_steps': ''})
             results.append(result_row)
             continue
 
-        # Define methods to test
-        methods = [
-            {'macro': False, 'search_method': 'astar', 'name': 'elem_astar'},
-            {'macro': False, 'search_method': 'bfs', 'name': 'elem_bfs'},
-            {'macro': True, 'search_method': 'astar', 'name': 'macro_astar'},
-            {'macro': True, 'search_method': 'bfs', 'name': 'macro_bfs'},
-        ]
-
         result_row = {'Warehouse': warehouse_name}
-        for m in methods:
+        warehouse_hash = file_hash(problem_file)
+        for m in METHODS:
             method_name = m['name']
-            print(f'Testing method: {method_name}')
-            result, time_taken, num_steps = test_with_timeout(problem_file, macro=m['macro'],
-                                                              search_method=m['search_method'], timeout=timeout,
-                                                              limit_of_boxes=limit_of_boxes)
+            stored = store.get(warehouse_hash, method_name, timeout)
+            if stored is None:
+                print(f'Testing method: {method_name}')
+                result, time_taken, num_steps, stats = test_with_timeout(problem_file, macro=m['macro'],
+                                                                         search_method=m['search_method'],
+                                                                         timeout=timeout, limit_of_boxes=limit_of_boxes,
+                                                                         memory_limit=memory_limit, timed=timed,
+                                                                         options=method_options(m))
+                # a memory limit result depends on the limit and a crash may not happen again, neither is stored
+                if result not in ("Skip", "Error", "MemoryLimit", "SolverError"):
+                    store.put(warehouse_hash, warehouse_name, method_name, timeout, result, time_taken, num_steps,
+                              stats)
+            else:
+                print(f'Stored result of method: {method_name}')
+                result, time_taken, num_steps, stats = stored
             if result == "Timed out":
                 print(f"Solver timed out: {timeout}s")
                 result_str = "Timed out"
@@ -163,6 +301,16 @@ def testAll(number=-1, timeout=180, limit_of_boxes=6):
                 result_str = "Error"
                 time_str = ''
                 steps_str = ''
+            elif result == "SolverError":
+                print("The solver failed.")
+                result_str = "SolverError"
+                time_str = ''
+                steps_str = ''
+            elif result == "MemoryLimit":
+                print(f"Solver exceeded the memory limit: {memory_limit} bytes")
+                result_str = "MemoryLimit"
+                time_str = f'{time_taken:.3f}s'
+                steps_str = ''
             else:
                 if result == "Impossible":
                     print("Puzzle is impossible to solve.")
@@ -177,6 +325,8 @@ def testAll(number=-1, timeout=180, limit_of_boxes=6):
             result_row[method_name] = result_str
             result_row[method_name + '_time'] = time_str
             result_row[method_name + '_steps'] = steps_str
+            for column, value in format_stats(stats).items():
+                result_row[method_name + '_' + column] = value
             print(f'Time taken: {time_str}')
             print(f'Number of steps: {steps_str}')
             print("")
@@ -184,65 +334,422 @@ def testAll(number=-1, timeout=180, limit_of_boxes=6):
 
     # Save results to CSV
     with open('results.csv', 'w', newline='') as csvfile:
-        fieldnames = ['Warehouse',
-                      'elem_astar', 'elem_astar_time', 'elem_astar_steps',
-                      'elem_bfs', 'elem_bfs_time', 'elem_bfs_steps',
-                      'macro_astar', 'macro_astar_time', 'macro_astar_steps',
-                      'macro_bfs', 'macro_bfs_time', 'macro_bfs_steps']
+        fieldnames = ['Warehouse']
+        for m in METHODS:
+            fieldnames += [m['name'], m['name'] + '_time', m['name'] + '_steps']
+            fieldnames += [m['name'] + '_' + column for column in STATS_COLUMNS]
         writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
         writer.writeheader()
         for row in results:
             writer.writerow(row)
+    store.close()
+
+
+def run_search(solver, search_method, weight=2.0, time_limit=None, stats=None, memory=None, compact=False):
+    '''
+    Run the search method named 'search_method' on the problem 'solver'
+    and return the goal node, or None if the problem has no solution.
+
+    'weighted_astar' returns a solution costing at most 'weight' times the
+    optimal cost. 'anytime' starts with that weight and improves its
+    solution until it is optimal or 'time_limit' seconds have passed, then
+    prints the bound it proved on the cost of the solution and records it
+    as the bound of 'stats'.
+
+    If 'stats' is a search.SearchStats, the graph searches (astar, bfs and
+    weighted_astar) update its counters, and the other searches mark them
+    as not counted; if it is timed, the time spent in each method of
+    'solver' is measured as well.
+
+    If 'memory' is a search.MemoryBudget, astar, bfs and weighted_astar
+    raise search.MemoryLimitExceeded when they go over it, while
+    'bounded_astar' switches to IDA*, which runs in fixed memory.
+
+    If 'compact' is True, astar, bounded_astar, bfs and weighted_astar keep
+    their explored states in the search.PackedStateSet of 'solver'.
+    '''
+    # each search gets its own explored set, which is not kept here, so
+    # bounded_astar frees it when it switches to IDA*
+    new_explored = solver.explored_set if compact else lambda: None
+    if stats is not None and search_method in ('idastar', 'bidirectional', 'anytime'):
+        stats.counted = False
+    if stats is not None and stats.timed:
+        solver = search.InstrumentedProblem(solver, stats)
+    if search_method == 'astar':
+        return search.astar_graph_search(solver, stats=stats, memory=memory, explored=new_explored())
+    elif search_method == 'bounded_astar':
+        return search.memory_bounded_astar_search(solver, memory or search.MemoryBudget(), stats=stats,
+                                                  explored=new_explored())
+    elif search_method == 'bfs':
+        return search.breadth_first_graph_search(solver, stats=stats, memory=memory, explored=new_explored())
+    elif search_method == 'idastar':
+        return search.iterative_deepening_astar_search(solver)
+    elif search_method == 'bidirectional':
+        return search.bidirectional_breadth_first_search(solver)
+    elif search_method == 'weighted_astar':
+        return search.weighted_astar_graph_search(solver, weight=weight, stats=stats, memory=memory,
+                                                  explored=new_explored())
+    elif search_method == 'anytime':
+        solution, bound = search.anytime_repairing_astar_search(solver, weight=weight, time_limit=time_limit)
+        if stats is not None:
+            stats.bound = bound
+        if solution:
+            print(f'Solution cost is at most {bound:.2f} times the optimal cost.')
+        return solution
+    else:
+        raise ValueError(f"Unknown search method: {search_method}")
+
+
+def record_pruning(solver, stats):
+    '''
+    Copy the number of states pruned by each rule of the SokobanPuzzle
+    'solver' into the search.SearchStats 'stats', if it is not None.
+    '''
+    if stats is None:
+        return
+    if solver.deadlock_detector is not None:
+        stats.pruned.update(solver.deadlock_detector.counters)
+    if solver.corral_pruning:
+        stats.pruned.update(('corral_' + name, count) for name, count in solver.corral_counters.items())
+
+
+# Warehouses of testAllParallel, given to each worker when it starts
+batch_warehouses: dict = {}
+
+
+def init_batch_worker(warehouses: dict):
+    '''
+    Initializer of the workers of testAllParallel. The parsed warehouses are
+    passed to each worker, which works with both the fork and the spawn
+    start methods.
+    '''
+    batch_warehouses.clear()
+    batch_warehouses.update(warehouses)
+
+
+# Without an alarm signal (Windows), a job cannot be timed out inside a
+# worker of the pool, it runs in a process of its own like in testAll
+JOB_ALARM = hasattr(signal, 'SIGALRM')
+
+
+class JobTimeout(BaseException):
+    '''
+    Raised by the alarm of batch_job. It is not an Exception, so that no
+    'except Exception' in or around the solver can swallow it.
+    '''
+    pass
 
 
-def solve_sokoban_elem(warehouse, search_method='astar'):
+def raise_job_timeout(signum, frame):
+    raise JobTimeout()
+
+
+def batch_job(job):
+    '''
+    Solve one (warehouse, method) job of testAllParallel in a worker of the
+    pool. The timeout is enforced with an alarm signal inside the worker,
+    so the worker is reused by the next job. The WarehouseIndex of each
+    warehouse is kept for the next jobs on it, but its region and distance
+    caches are emptied after every job, so they do not pile up in the
+    worker from one job to the next.
+    An exception raised by the solver is printed and gives the result
+    "SolverError", as opposed to "Error" for a warehouse that cannot be loaded.
+    Without JOB_ALARM, the job is run by test_with_timeout instead.
+    '''
+    warehouse_name, method, timeout, limit_of_boxes, memory_limit, timed = job
+    wh = batch_warehouses[warehouse_name]
+    if len(wh.boxes) > limit_of_boxes:
+        return warehouse_name, method['name'], "Skip", None, None, None
+    if not JOB_ALARM:
+        result, time_taken, num_steps, stats = test_with_timeout(os.path.join('warehouses', warehouse_name),
+                                                                 method['macro'], method['search_method'],
+                                                                 timeout, limit_of_boxes, memory_limit, timed,
+                                                                 method_options(method))
+        if result not in ("Timed out", "Error", "MemoryLimit", "Impossible", "SolverError"):
+            result = "Solution found"
+        return warehouse_name, method['name'], result, time_taken, num_steps, stats
+
+    stats = search.SearchStats(timed=timed)
+    memory = search.MemoryBudget(max_rss=memory_limit)
+    start_time = time.time()
+    previous_handler = signal.getsignal(signal.SIGALRM)
+    try:
+        # the alarm fires at most once, so a JobTimeout can only be raised
+        # before it is disarmed, and is caught below even if it comes late
+        try:
+            signal.signal(signal.SIGALRM, raise_job_timeout)
+            signal.setitimer(signal.ITIMER_REAL, timeout)
+            if method['macro']:
+                answer, num_steps = solve_sokoban_macro(wh, search_method=method['search_method'], stats=stats,
+                                                        memory=memory, **method_options(method))
+            else:
+                answer, num_steps = solve_sokoban_elem(wh, search_method=method['search_method'], stats=stats,
+                                                       memory=memory, **method_options(method))
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        result = "Impossible" if answer == "Impossible" else "Solution found"
+    except search.MemoryLimitExceeded:
+        result, num_steps = "MemoryLimit", None
+    except JobTimeout:
+        return warehouse_name, method['name'], "Timed out", None, None, None
+    except Exception as e:
+        print(f"{warehouse_name} {method['name']}: the solver raised {type(e).__name__}")
+        traceback.print_exc()
+        return warehouse_name, method['name'], "SolverError", None, None, None
+    finally:
+        signal.signal(signal.SIGALRM, previous_handler)
+        for index in mySokobanSolver.warehouse_index_cache.values():
+            index.clear_search_caches()
+    time_taken = time.time() - start_time
+    memory.sample()
+    stats.peak_rss = memory.peak_rss
+    return warehouse_name, method['name'], result, time_taken, num_steps, stats.as_dict()
+
+
+def testAllParallel(number=-1, timeout=180, limit_of_boxes=6, methods=None, processes=None,
+                    csv_file='results_parallel.csv', results_db=RESULTS_DB, memory_limit=None, timed=False):
+    '''
+    Run every method of 'methods' (METHODS by default) on the warehouses like
+    testAll, spreading the (warehouse, method) jobs over a pool of
+    'processes' workers, one per core by default. The warehouses are parsed
+    once before the pool starts, and each result is written to 'csv_file'
+    as soon as its job finishes, one row per job. Jobs whose result is in
+    the ResultsStore 'results_db' are not run again, their stored result is
+    written first. A job whose worker grows by more than 'memory_limit'
+    bytes of resident memory during the job stops with the result
+    "MemoryLimit", and a job whose solver raises an exception with the
+    result "SolverError"; neither is stored. The phase timers of the
+    statistics are only filled in if 'timed' is True. Without JOB_ALARM,
+    the pool is made of threads, each running its jobs in a process of
+    their own.
+    '''
+    file_name = "*" if number == -1 else f"warehouse_{number:04}"
+    all_warehouses = sorted(glob.glob('warehouses/' + file_name + '.txt'))
+    methods = METHODS if methods is None else methods
+    store = ResultsStore(results_db, timed=timed)
+    warehouses = {}
+    warehouse_hashes = {}
+
+    with open(csv_file, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(['Warehouse', 'Method', 'Result', 'Time', 'Steps'] + STATS_COLUMNS)
+
+        for problem_file in all_warehouses:
+            warehouse_name = os.path.basename(problem_file)
+            wh = sokoban.Warehouse()
+            try:
+                wh.load_warehouse(problem_file)
+                warehouses[warehouse_name] = wh
+                warehouse_hashes[warehouse_name] = file_hash(problem_file)
+            except Exception:
+                print(f"An error occurred when loading {warehouse_name}.")
+                for m in methods:
+                    writer.writerow([warehouse_name, m['name'], 'Error', '', ''] + [''] * len(STATS_COLUMNS))
+
+        def write_result(warehouse_name, method_name, result, time_taken, num_steps, stats):
+            time_str = f'{time_taken:.3f}s' if time_taken is not None else ''
+            steps_str = str(num_steps) if result == "Solution found" else ''
+            print(f'{warehouse_name} {method_name}: {result} {time_str}')
+            writer.writerow([warehouse_name, method_name, result, time_str, steps_str]
+                            + list(format_stats(stats).values()))
+            csvfile.flush()
+
+        jobs = []
+        for warehouse_name in warehouses:
+            for m in methods:
+                stored = store.get(warehouse_hashes[warehouse_name], m['name'], timeout)
+                if stored is None:
+                    jobs.append((warehouse_name, m, timeout, limit_of_boxes, memory_limit, timed))
+                else:
+                    write_result(warehouse_name, m['name'], *stored)
+
+        pool_class = mp.Pool if JOB_ALARM else mp.pool.ThreadPool
+        with pool_class(processes, initializer=init_batch_worker, initargs=(warehouses,)) as pool:
+            for warehouse_name, method_name, result, time_taken, num_steps, stats in pool.imap_unordered(batch_job,
+                                                                                                          jobs):
+                if result not in ("Skip", "Error", "MemoryLimit", "SolverError"):
+                    store.put(warehouse_hashes[warehouse_name], warehouse_name, method_name, timeout,
+                              result, time_taken, num_steps, stats)
+                write_result(warehouse_name, method_name, result, time_taken, num_steps, stats)
+    store.close()
+
+
+def solve_sokoban_elem(warehouse, search_method='astar', weight=2.0, time_limit=None, stats=None, memory=None,
+                       compact=False):
     '''
     This function solves the Sokoban puzzle using elementary actions.
 
     @param warehouse: a valid Warehouse object
-    @param search_method: 'astar' or 'bfs' indicating which search method to use
+    @param search_method: 'astar', 'bfs', 'idastar', 'bounded_astar', 'bidirectional', 'weighted_astar' or
+        'anytime' indicating which search method to use, see run_search.
+        'idastar' is A* in fixed memory, 'bounded_astar' switches to it when A* goes over 'memory'.
+        'bidirectional' searches the macro pushes from both ends and expands the
+        pushes into elementary actions, so its solution is not the shortest
+    @param weight: weight of the heuristic of 'weighted_astar' and first weight of 'anytime'
+    @param time_limit: number of seconds 'anytime' may spend improving its solution, None for no limit
+    @param stats: a search.SearchStats to fill in, or None
+    @param memory: a search.MemoryBudget of the search, or None
+    @param compact: whether to keep the explored states in a search.PackedStateSet instead of a set
 
     @return
         If puzzle cannot be solved return the string 'Impossible' and None for steps
         If a solution was found, return the solution and the number of steps
     '''
-    solver = SokobanPuzzle(warehouse)
-    if search_method == 'astar':
-        solution = search.astar_graph_search(solver)
-    elif search_method == 'bfs':
-        solution = search.breadth_first_graph_search(solver)
+    if search_method == 'bidirectional':
+        solver = SokobanPuzzle(warehouse, macro=True)
+        try:
+            solution = run_search(solver, search_method, stats=stats)
+        finally:
+            record_pruning(solver, stats)
+        if solution:
+            actions = expand_macro_solution(warehouse, solution.solution())
+            if actions == 'Failure':
+                raise RuntimeError('the bidirectional macro solution cannot be expanded into elementary actions')
+            return actions, len(actions)
     else:
-        raise ValueError(f"Unknown search method: {search_method}")
+        solver = SokobanPuzzle(warehouse)
+        try:
+            solution = run_search(solver, search_method, weight, time_limit, stats, memory, compact)
+        finally:
+            record_pruning(solver, stats)
     if solution:
         return solution.solution(), solution.path_cost
     else:
         return "Impossible", None
 
 
-def solve_sokoban_macro(warehouse, search_method='astar'):
+def solve_sokoban_macro(warehouse, search_method='astar', corral_pruning=True, cost='pushes', weight=2.0,
+                        time_limit=None, stats=None, memory=None, compact=False):
     '''
     Solve the Sokoban puzzle using macro actions.
 
     @param warehouse: a valid Warehouse object
-    @param search_method: 'astar' or 'bfs' indicating which search method to use
+    @param search_method: 'astar', 'bfs', 'idastar', 'bounded_astar', 'bidirectional', 'weighted_astar' or
+        'anytime' indicating which search method to use, see run_search.
+        'idastar' is A* in fixed memory, 'bounded_astar' switches to it when A* goes over 'memory'.
+        'bidirectional', 'idastar' and 'bounded_astar' only support the cost 'pushes'
+    @param corral_pruning: whether to restrict the pushes to those of a PI-corral when there is one
+    @param cost: 'pushes', 'moves' or 'pushes_moves', see SokobanPuzzle
+    @param weight: weight of the heuristic of 'weighted_astar' and first weight of 'anytime'
+    @param time_limit: number of seconds 'anytime' may spend improving its solution, None for no limit
+    @param stats: a search.SearchStats to fill in, or None
+    @param memory: a search.MemoryBudget of the search, or None
+    @param compact: whether to keep the explored states in a search.PackedStateSet instead of a set
 
     @return
         If puzzle cannot be solved return the string 'Impossible' and None for steps
-        Otherwise return the solution and the number of steps
+        Otherwise return the solution and the number of steps, which are
+        pushes for the cost 'pushes' and moves otherwise
     '''
-    solver = SokobanPuzzle(warehouse, macro=True)
-    if search_method == 'astar':
-        solution = search.astar_graph_search(solver)
-    elif search_method == 'bfs':
-        solution = search.breadth_first_graph_search(solver)
-    else:
-        raise ValueError(f"Unknown search method: {search_method}")
+    # the backward search needs free walking, and IDA*, also the fall-back of bounded A*, would raise its
+    # bound by one move per iteration over the range of PUSH_COST
+    if search_method in ('bidirectional', 'idastar', 'bounded_astar') and cost != 'pushes':
+        raise ValueError(f"{search_method!r} only supports the cost 'pushes', not {cost!r}")
+    solver = SokobanPuzzle(warehouse, macro=True, corral_pruning=corral_pruning, cost=cost)
+    try:
+        solution = run_search(solver, search_method, weight, time_limit, stats, memory, compact)
+    finally:
+        record_pruning(solver, stats)
     if solution:
-        return solution.solution(), solution.path_cost
+        return solution.solution(), solution.path_cost % PUSH_COST
     else:
         return "Impossible", None
 
 
+# Configurations of solve_sokoban_macro raced by solve_sokoban_portfolio
+PORTFOLIO = [
+    {'search_method': 'astar'},
+    {'search_method': 'weighted_astar', 'weight': 2.0},
+    {'search_method': 'bidirectional'},
+    {'search_method': 'astar', 'corral_pruning': False},
+]
+
+# Seconds solve_sokoban_portfolio waits for an answer before it checks
+# whether a process died without answering
+PORTFOLIO_POLL = 1.0
+
+
+def portfolio_worker(warehouse, number, config, q: mp.Queue):
+    try:
+        solution, num_steps = solve_sokoban_macro(warehouse, **config)
+    except Exception as e:
+        print(f"{config}: the solver raised {type(e).__name__}")
+        traceback.print_exc()
+        solution, num_steps = "Error", None
+    q.put((number, solution, num_steps))
+
+
+def is_macro_solution(warehouse, solution) -> bool:
+    '''
+    Return True if the macro actions 'solution' are legal and leave every
+    box on a target.
+    '''
+    actions = expand_macro_solution(warehouse, solution)
+    if actions == 'Failure':
+        return False
+    return '$' not in check_action_seq(warehouse, actions)  # '$' is a box off target
+
+
+def solve_sokoban_portfolio(warehouse, configs=None, timeout=None):
+    '''
+    Solve the Sokoban puzzle using macro actions, by running several
+    configurations of solve_sokoban_macro at the same time, each in its own
+    process. The first verified solution is returned and the other
+    processes are stopped. Every configuration searches all the states it
+    does not prune, so the first 'Impossible' answer is final. A process
+    that dies without answering, killed by the OOM killer for instance,
+    counts as a failed configuration, and a RuntimeError is raised if every
+    configuration failed.
+
+    @param warehouse: a valid Warehouse object
+    @param configs: list of keyword arguments of solve_sokoban_macro, PORTFOLIO by default
+    @param timeout: number of seconds to wait for an answer, None to wait until one arrives
+
+    @return
+        If puzzle cannot be solved return the string 'Impossible' and None for steps
+        If no configuration answered in time return the string 'Timed out' and None for steps
+        Otherwise return the solution and the number of steps of the configuration that found it first
+    '''
+    configs = PORTFOLIO if configs is None else configs
+    q_worker = mp.Queue()
+    procs = [mp.Process(target=portfolio_worker, args=(warehouse, number, config, q_worker))
+             for number, config in enumerate(configs)]
+    for proc in procs:
+        proc.start()
+
+    result, num_steps = "Timed out", None
+    deadline = None if timeout is None else time.time() + timeout
+    answered = set()  # numbers of the configurations that answered or died
+    try:
+        while len(answered) < len(procs):
+            wait = PORTFOLIO_POLL if deadline is None else min(deadline - time.time(), PORTFOLIO_POLL)
+            if wait <= 0:
+                break
+            try:
+                number, solution, steps = q_worker.get(timeout=wait)
+            except mpq.Empty:
+                for number, proc in enumerate(procs):
+                    if proc.exitcode not in (None, 0) and number not in answered:
+                        print(f'{configs[number]} stopped with exit code {proc.exitcode}')
+                        answered.add(number)
+                continue
+            answered.add(number)
+            if solution == "Impossible":
+                result, num_steps = solution, None
+                break
+            if solution != "Error" and is_macro_solution(warehouse, solution):
+                print(f'Solution found by {configs[number]}')
+                result, num_steps = solution, steps
+                break
+        else:
+            raise RuntimeError('every configuration of the portfolio failed')
+    finally:
+        for proc in procs:
+            proc.terminate()
+            proc.join()
+    return result, num_steps
+
+
 # Ensure that all necessary modules and classes are imported and defined as per your previous code.
 # This includes SokobanPuzzle, movements, and any helper functions.
 
@@ -28,6 +28,15 @@ import sys
 assert sys.version_info >= (3, 5)
 
 import itertools
+import time
+from array import array
+
+try:
+    import resource # not available on Windows
+except ImportError:
+    resource = None
+
+infinity = float('inf')
 
 
 # momoization decorator
@@ -101,17 +110,32 @@ class PriorityQueue(Queue):
     """
     A queue in which the minimum  element (as determined by f) is returned first.
     The item with minimum f(x) is returned first
+
+    Items are also indexed in a dict by key(item), so membership tests,
+    lookups and deletions take O(1) time; they take the key of an item,
+    which is the item itself by default. A deleted item is not taken out
+    of the heap, its entry is only marked as removed and skipped later by pop.
     """
-    def __init__(self, f=lambda x: x):
-        self.heap = []  # list of pairs  (f(item), counter_value, item)
+    REMOVED = object() # placeholder for the item of a deleted entry
+
+    def __init__(self, f=lambda x: x, key=lambda x: x):
+        self.heap = []  # list of entries  [f(item), counter_value, item]
+        self.entries = {} # key(item) -> the live entry of item on the heap
         self.f = f
+        self.key = key
         self.counter = itertools.count() # unique sequence count
         # counter_value is used to break ties between items that
         # have the same 'f' value
         
     def append(self, item):
-        # thw pair  (f(item), counter_value, item)  is pushed on the internal heapq
-        heapq.heappush(self.heap, (self.f(item),next(self.counter),  item))
+        # the entry  [f(item), counter_value, item]  is pushed on the internal heapq
+        # an item with the same key already in the queue is replaced
+        key = self.key(item)
+        if key in self.entries:
+            del self[key]
+        entry = [self.f(item), next(self.counter), item]
+        self.entries[key] = entry
+        heapq.heappush(self.heap, entry)
 
     def extend(self, items):
         """Insert each item in items at its correct position."""
@@ -119,36 +143,169 @@ class PriorityQueue(Queue):
             self.append(item)
                 
     def __len__(self):
-        return len(self.heap)
+        return len(self.entries)
     
     def __str__(self):
-        return str(self.heap)
+        return str([entry for entry in self.heap if entry[-1] is not self.REMOVED])
     
     def pop(self):
         """Pop and return the item with min f(x) value """
-        if self.heap:
-            # item is the last element of the tuple  (f(item), counter_value, item) 
-            return heapq.heappop(self.heap)[-1]
-        else:
-            raise Exception('Trying to pop from empty PriorityQueue.')
+        while self.heap:
+            # item is the last element of the entry  [f(item), counter_value, item]
+            item = heapq.heappop(self.heap)[-1]
+            if item is not self.REMOVED:
+                del self.entries[self.key(item)]
+                return item
+        raise Exception('Trying to pop from empty PriorityQueue.')
     
-    def __contains__(self, item):
-        """Return True if item in PriorityQueue."""
-        return (self.f(item), item) in self.heap
+    def __contains__(self, key):
+        """Return True if an item with this key is in PriorityQueue."""
+        return key in self.entries
 
     def __getitem__(self, key):
-        for _,_, item in self.heap:
-            # Note that two instances of 'Node' are considered
-            # equal if their corresponding states are the same.
-            if item == key:
-                return item
+        # Note that two instances of 'Node' are considered
+        # equal if their corresponding states are the same.
+        # Returns the item with this key, or None.
+        entry = self.entries.get(key)
+        if entry:
+            return entry[-1]
             
     def __delitem__(self, key):
-        for f_value,count_value,item in self.heap:
-            if item == key:
-                self.heap.remove((f_value,count_value,item))
+        entry = self.entries.pop(key, None)
+        if entry:
+            entry[-1] = self.REMOVED
+            # rebuild the heap once most of its entries are stale
+            if len(self.heap) > 2 * len(self.entries) + 64:
+                self.heap = [entry for entry in self.heap if entry[-1] is not self.REMOVED]
                 heapq.heapify(self.heap)
-                return
+
+
+class TranspositionTable:
+    """
+    A fixed-size table remembering the lowest path cost a state was reached
+    with during an iteration of a depth-first search. A state hashes to a
+    single slot; a new state takes the slot over if it is empty, holds an
+    entry of an older iteration, or of a more expensive path.
+    The memory used never grows past 'size' slots.
+    """
+    def __init__(self, size=1 << 20):
+        self.slots = [None] * size  # entries  (state, path_cost, iteration)
+        self.size = size
+
+    def visited(self, state, path_cost, iteration):
+        """Return True if state was already reached in this iteration with
+        a path no more expensive, otherwise record it and return False."""
+        slot = hash(state) % self.size
+        entry = self.slots[slot]
+        if entry is not None and entry[2] == iteration:
+            if entry[0] == state and entry[1] <= path_cost:
+                return True
+            if entry[1] < path_cost:
+                return False  # keep the entry nearer to the root
+        self.slots[slot] = (state, path_cost, iteration)
+        return False
+
+
+class PackedStateSet:
+    """
+    A set of states for the explored set of the graph searches, in place of
+    a Python set. pack(state) must map each state to a distinct integer of
+    at most key_bits bits. The integers are stored as fixed-width keys of
+    64 bit words in an open addressing hash table with linear probing, held
+    in one preallocated array that doubles when it is more than max_load
+    full. The first word of a key holds its lowest 63 bits and a flag bit,
+    so a slot is empty when its first word is 0 and most probes only read
+    that word; the other words hold the rest of the key.
+    A state takes 8 bytes per word of its key divided by the load, instead
+    of the 100 bytes or more of a tuple of ints in a set, at the price of
+    slower additions and membership tests. While the table doubles, the
+    old and the new array both exist.
+    States can only be added and tested, not removed or iterated, but the
+    whole set can be emptied with clear, which frees its table.
+    """
+    MIX = 0x9E3779B97F4A7C15 # 2**64 divided by the golden ratio, spreads the hashes
+    WORD_MASK = (1 << 64) - 1
+    LOW_MASK = (1 << 63) - 1
+    FLAG = 1 << 63 # set in the first word of every stored key
+
+    def __init__(self, pack, key_bits, capacity=1 << 16, max_load=0.5):
+        self.pack = pack
+        self.words = key_bits // 64 + 1
+        self.max_load = max_load
+        self.count = 0
+        self.allocate(max(16, 1 << (capacity - 1).bit_length()))
+
+    def allocate(self, capacity):
+        self.capacity = capacity # a power of two
+        self.shift = 64 - capacity.bit_length() + 1
+        self.limit = int(capacity * self.max_load)
+        self.table = array('Q', bytes(8 * self.words * capacity))
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.count = 0
+        self.allocate(16)
+
+    def __contains__(self, state):
+        return self.table[self.words * self.find(self.pack(state))] != 0
+
+    def add(self, state):
+        self.insert(self.pack(state))
+
+    def insert(self, key):
+        start = self.words * self.find(key)
+        if self.table[start]:
+            return
+        self.table[start] = key & self.LOW_MASK | self.FLAG
+        high = key >> 63
+        for offset in range(1, self.words):
+            self.table[start + offset] = high & self.WORD_MASK
+            high >>= 64
+        self.count += 1
+        if self.count > self.limit:
+            self.resize()
+
+    def find(self, key):
+        """Return the slot holding key, or the empty slot where it goes."""
+        table, words, mask = self.table, self.words, self.capacity - 1
+        first = key & self.LOW_MASK | self.FLAG
+        slot = (hash(key) * self.MIX & self.WORD_MASK) >> self.shift
+        while True:
+            start = words * slot
+            word = table[start]
+            if word == 0:
+                return slot
+            if word == first:
+                if words == 1:
+                    return slot
+                if words == 2:
+                    if table[start + 1] == key >> 63:
+                        return slot
+                elif self.high_bits(start) == key >> 63:
+                    return slot
+            slot = (slot + 1) & mask
+
+    def high_bits(self, start):
+        """Return the bits above the lowest 63 of the key stored at start."""
+        high = 0
+        for offset in range(self.words - 1, 0, -1):
+            high = high << 64 | self.table[start + offset]
+        return high
+
+    def resize(self):
+        """Double the capacity and insert the keys again."""
+        table, words = self.table, self.words
+        self.allocate(2 * self.capacity)
+        self.count = 0
+        for start in range(0, len(table), words):
+            first = table[start]
+            if first:
+                high = 0
+                for offset in range(words - 1, 0, -1):
+                    high = high << 64 | table[start + offset]
+                self.insert(high << 63 | first & self.LOW_MASK)
 
 #______________________________________________________________________________
 
@@ -183,6 +340,23 @@ class Problem(object):
         method if checking against a single self.goal is not enough."""
         return state == self.goal
 
+    # Optional hook. A subclass can define a method successors(state) that
+    # yields a triple (action, next_state, step_cost) for each action that
+    # can be executed in the given state. Node.expand then uses it instead of
+    # calling actions, result and path_cost separately, which lets the problem
+    # share the work done for all the successors of a state in a single pass.
+    successors = None
+
+    def goal_states(self):
+        """Return the goal states, for searches that start from the goal side
+        such as bidirectional_breadth_first_search."""
+        raise NotImplementedError
+
+    def predecessors(self, state):
+        """Return the (action, previous_state) pairs such that executing
+        action in previous_state results in the given state."""
+        raise NotImplementedError
+
     def path_cost(self, c, state1, action, state2):
         """Return the cost of a solution path that arrives at state2 from
         state1 via action, assuming cost c to get up to state1. If the problem
@@ -195,6 +369,165 @@ class Problem(object):
         """For optimization problems, each state has a value.  Hill-climbing
         and related algorithms try to maximize this value."""
         raise NotImplementedError
+
+
+class SearchStats:
+    """
+    Counters of a search, updated by the graph search functions when they
+    are given one as their 'stats' argument:
+    - expanded: nodes expanded
+    - generated: children generated
+    - duplicates: children whose state was already explored or in the frontier
+    - improved: duplicates that replaced a frontier node with a cheaper path
+      (a decrease-key; explored nodes are never reopened)
+    - max_frontier, max_explored: peak sizes of the frontier and explored set
+    - peak_rss: peak growth in bytes of the resident set size, as read by a MemoryBudget,
+      or None where it cannot be read
+    - bound: the cost of the solution of an anytime search is proven at most
+      bound times the optimal cost, None for the other searches
+    - pruned: the number of states pruned by each pruning rule of the
+      problem, by name, filled in by the caller as only the problem knows
+      its rules; as_dict gives them as 'pruned_<name>' entries
+    and, if timed, of the time spent in each method of the problem, filled
+    in by an InstrumentedProblem sharing these stats. The timers are off by
+    default, as they slow the search down by a quarter to a third; their
+    entries in as_dict are then None.
+    A search that does not update the counters sets counted to False, and
+    as_dict then gives None for all of them but peak_rss.
+    Without a SearchStats the searches run as before.
+    """
+    COUNTERS = ('expanded', 'generated', 'duplicates', 'improved', 'max_frontier', 'max_explored', 'peak_rss')
+    PHASES = ('successors', 'actions', 'result', 'h', 'goal_test')
+
+    def __init__(self, timed=False):
+        for counter in self.COUNTERS:
+            setattr(self, counter, 0)
+        self.bound = None
+        self.pruned = {} # rule name -> states pruned
+        self.counted = True
+        self.timed = timed
+        self.timers = dict.fromkeys(self.PHASES, 0.0 if timed else None) # phase -> seconds
+
+    def expansion(self, num_of_children, num_of_new, frontier_size, explored_size):
+        """Count the expansion of a node with num_of_children children, of
+        which num_of_new entered the frontier as new nodes."""
+        self.expanded += 1
+        self.generated += num_of_children
+        self.duplicates += num_of_children - num_of_new
+        if frontier_size > self.max_frontier:
+            self.max_frontier = frontier_size
+        if explored_size > self.max_explored:
+            self.max_explored = explored_size
+
+    def as_dict(self):
+        """Return the counters, the bound, the timers, as 'time_<phase>'
+        entries, and the pruned states, as 'pruned_<name>' entries."""
+        stats = {counter: getattr(self, counter) if self.counted or counter == 'peak_rss' else None
+                 for counter in self.COUNTERS}
+        stats['bound'] = self.bound
+        stats.update(('time_' + phase, seconds) for phase, seconds in self.timers.items())
+        stats.update(('pruned_' + name, count) for name, count in self.pruned.items())
+        return stats
+
+
+class InstrumentedProblem(Problem):
+    """
+    A problem delegating to another one, that adds the time spent in its
+    actions, result, successors, h and goal_test methods to the timers
+    of a SearchStats. Search with it instead of the problem itself.
+    """
+    def __init__(self, problem, stats):
+        self.problem = problem
+        self.initial, self.goal = problem.initial, problem.goal
+        for name in self.stats_phases(problem):
+            setattr(self, name, self.timed(getattr(problem, name), stats.timers, name))
+
+    @staticmethod
+    def stats_phases(problem):
+        return [phase for phase in SearchStats.PHASES if getattr(problem, phase, None) is not None]
+
+    @staticmethod
+    def timed(fn, timers, phase):
+        perf_counter = time.perf_counter
+        def timed_fn(*args):
+            start = perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                timers[phase] += perf_counter() - start
+        return timed_fn
+
+    def path_cost(self, c, state1, action, state2):
+        return self.problem.path_cost(c, state1, action, state2)
+
+    def goal_states(self):
+        return self.problem.goal_states()
+
+    def predecessors(self, state):
+        return self.problem.predecessors(state)
+
+    def __getattr__(self, name):
+        return getattr(self.problem, name)
+
+
+def current_rss():
+    """Return the resident set size of the process in bytes, read from /proc
+    on Linux, or None where it cannot be read. Other systems only give the
+    peak resident set size of the process, which does not fall when memory
+    is freed and so cannot tell how much a search added."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize()
+    except (OSError, AttributeError):
+        return None
+
+
+class MemoryLimitExceeded(Exception):
+    """Raised by a search that went over its MemoryBudget."""
+    pass
+
+
+class MemoryBudget:
+    """
+    A memory budget for the graph searches, given one as their 'memory'
+    argument. They call check after each expansion, which raises
+    MemoryLimitExceeded once the frontier and the explored set hold more
+    than max_states states together, or the resident set size of the
+    process has grown by more than max_rss bytes since the budget was
+    made. None means no limit. Only the growth is counted, so a process
+    running one search after another, such as a worker of a pool, does
+    not charge a search for the memory still held after the previous ones.
+    The resident set size is only read every check_interval expansions,
+    and peak_rss is the largest growth read.
+    max_rss is only enforced where current_rss can read the resident set
+    size, that is on Linux; elsewhere peak_rss is None.
+    """
+    def __init__(self, max_rss=None, max_states=None, check_interval=1000):
+        self.max_rss = max_rss
+        self.max_states = max_states
+        self.check_interval = check_interval
+        self.countdown = check_interval
+        self.start_rss = current_rss()
+        self.peak_rss = None if self.start_rss is None else 0
+
+    def sample(self):
+        """Read the growth of the resident set size and return it, or None
+        if it cannot be read."""
+        if self.start_rss is None:
+            return None
+        rss = current_rss() - self.start_rss
+        self.peak_rss = max(self.peak_rss, rss)
+        return rss
+
+    def check(self, frontier_size, explored_size):
+        if self.max_states is not None and frontier_size + explored_size > self.max_states:
+            raise MemoryLimitExceeded(f'{frontier_size + explored_size} states stored, the limit is {self.max_states}')
+        self.countdown -= 1
+        if self.countdown == 0:
+            self.countdown = self.check_interval
+            rss = self.sample()
+            if self.max_rss is not None and rss is not None and rss > self.max_rss:
+                raise MemoryLimitExceeded(f'{rss} more bytes resident, the limit is {self.max_rss}')
 #______________________________________________________________________________
 
 class Node:
@@ -203,26 +536,52 @@ class Node:
     that this is a successor of) and to the actual state for this node. Note
     that if a state is arrived at by two paths, then there are two nodes with
     the same state.  Also includes the action that got us to this state, and
-    the total path_cost (also known as g) to reach the node.  Other functions
-    may add an f and h value; see best_first_graph_search and astar_search for
-    an explanation of how the f and h values are handled. You will not need to
-    subclass this class.
+    the total path_cost (also known as g) to reach the node.  See
+    best_first_graph_search and astar_search for an explanation of how the
+    f and h values are handled. You will not need to subclass this class.
+
+    Nodes only have the four slots below and no __dict__, as the searches
+    keep one node for every state on the frontier. The depth and the path
+    are recomputed from the parent chain when they are asked for.
     """
+    __slots__ = ('state', 'parent', 'action', 'path_cost')
 
     def __init__(self, state, parent=None, action=None, path_cost=0):
         "Create a search tree Node, derived from a parent by an action."
-        update(self, state=state, parent=parent, action=action,
-               path_cost=path_cost, depth=0)
-        if parent:
-            self.depth = parent.depth + 1
+        self.state = state
+        self.parent = parent
+        self.action = action
+        self.path_cost = path_cost
 
     def __repr__(self):
         return "<Node %s>" % (self.state,)
 
+    @property
+    def depth(self):
+        "Number of actions from the root to this node."
+        node, depth = self.parent, 0
+        while node:
+            node, depth = node.parent, depth + 1
+        return depth
+
     def expand(self, problem):
         "List the nodes reachable in one step from this node."
-        return [self.child_node(problem, action)
-                for action in problem.actions(self.state)]
+        return [Node(next_state, self, action, path_cost)
+                for action, next_state, path_cost in self.successors(problem)]
+
+    def successors(self, problem):
+        """Return the (action, next_state, path_cost) triples of the children
+        of this node without building them, path_cost being the cost of the
+        path from the root to the child. Uses problem.successors if defined."""
+        if problem.successors is not None:
+            return [(action, next_state, self.path_cost + step_cost)
+                    for action, next_state, step_cost in problem.successors(self.state)]
+        successors = []
+        for action in problem.actions(self.state):
+            next_state = problem.result(self.state, action)
+            successors.append((action, next_state,
+                               problem.path_cost(self.path_cost, self.state, action, next_state)))
+        return successors
 
     def child_node(self, problem, action):
         "Fig. 3.10"
@@ -277,27 +636,43 @@ def tree_search(problem, frontier):
         frontier.extend(node.expand(problem))
     return None
 
-def graph_search(problem, frontier):
+def graph_search(problem, frontier, stats=None, memory=None, explored=None):
     """
     Search through the successors of a problem to find a goal.
     The argument frontier should be an empty queue.
     If two paths reach a state, only use the first one. [Fig. 3.7]
+    The states of the frontier are kept with the explored states, in a
+    single set of the states reached so far.
+    If stats is a SearchStats, its counters are updated.
+    If memory is a MemoryBudget, MemoryLimitExceeded is raised when the
+    search goes over it.
+    If explored is an empty PackedStateSet, it stores the reached states
+    instead of a set.
     Return
         the node of the first goal state found
         or None is no goal state is found
     """
     assert isinstance(problem, Problem)
     frontier.append(Node(problem.initial))
-    explored = set() # initial empty set of explored states
+    if explored is None:
+        explored = set() # states explored or in the frontier
+    explored.add(problem.initial)
     while frontier:
         node = frontier.pop()
         if problem.goal_test(node.state):
             return node
-        explored.add(node.state)
-        # Python note: next line uses of a generator
-        frontier.extend(child for child in node.expand(problem)
-                        if child.state not in explored
-                        and child not in frontier)
+        # a node is only built for the children that enter the frontier
+        successors = node.successors(problem)
+        frontier_size = len(frontier)
+        for action, child_state, path_cost in successors:
+            if child_state not in explored:
+                frontier.append(Node(child_state, node, action, path_cost))
+                explored.add(child_state)
+        if stats is not None:
+            stats.expansion(len(successors), len(frontier) - frontier_size,
+                            len(frontier), len(explored) - len(frontier))
+        if memory is not None:
+            memory.check(len(frontier), len(explored) - len(frontier))
     return None
 
 
@@ -316,9 +691,9 @@ def depth_first_graph_search(problem):
     return graph_search(problem, LIFOQueue())
 
 
-def breadth_first_graph_search(problem):
+def breadth_first_graph_search(problem, stats=None, memory=None, explored=None):
     "Graph search version of BFS.  [Fig. 3.11]"
-    return graph_search(problem, FIFOQueue())
+    return graph_search(problem, FIFOQueue(), stats, memory, explored)
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - 
 
@@ -350,49 +725,71 @@ def best_first_tree_search(problem, f):
 
 
 
-def best_first_graph_search(problem, f):
+def best_first_graph_search(problem, f, stats=None, memory=None, explored=None):
     """
     Search the nodes with the lowest f scores first.
     You specify the function f(node) that you want to minimize; for example,
     if f is a heuristic estimate to the goal, then we have greedy best
     first search; if f is node.depth then we have breadth-first search.
+    A child whose state is on the frontier replaces the node there if its
+    f is lower. Only a cheaper path is compared, so f must not decrease
+    when the path cost of a node does not, which holds for all the above;
+    a node is then only built for the children that enter the frontier.
+    If stats is a SearchStats, its counters are updated.
+    If memory is a MemoryBudget, MemoryLimitExceeded is raised when the
+    search goes over it.
+    If explored is an empty PackedStateSet, it stores the explored states
+    instead of a set.
     """
     node = Node(problem.initial)
     if problem.goal_test(node.state):
         return node
-    frontier = PriorityQueue(f)
+    frontier = PriorityQueue(f, key=lambda node: node.state)
     frontier.append(node)
-    explored = set()
+    if explored is None:
+        explored = set()
     while frontier:
         node = frontier.pop()
         if problem.goal_test(node.state):
             return node
         explored.add(node.state)
-        for child in node.expand(problem):
-            if child.state not in explored and child not in frontier:
-                frontier.append(child)
-            elif child in frontier:
-                incumbent = frontier[child] # incumbent is a node
-                if f(child) < f(incumbent):
-                    del frontier[incumbent]
+        successors = node.successors(problem)
+        frontier_size = len(frontier)
+        for action, child_state, path_cost in successors:
+            if child_state in explored:
+                continue # skipped before a node is built for it
+            entry = frontier.entries.get(child_state) # [f(incumbent), counter_value, incumbent]
+            if entry is None:
+                frontier.append(Node(child_state, node, action, path_cost))
+            elif path_cost < entry[-1].path_cost:
+                child = Node(child_state, node, action, path_cost)
+                if f(child) < entry[0]:
+                    del frontier[child_state]
                     frontier.append(child)
+                    if stats is not None:
+                        stats.improved += 1
+        if stats is not None:
+            stats.expansion(len(successors), len(frontier) - frontier_size,
+                            len(frontier), len(explored))
+        if memory is not None:
+            memory.check(len(frontier), len(explored))
     return None
 
-def uniform_cost_search(problem):
+def uniform_cost_search(problem, stats=None, memory=None, explored=None):
     "[Fig. 3.14]"
-    return best_first_graph_search(problem, lambda node: node.path_cost)
+    return best_first_graph_search(problem, lambda node: node.path_cost, stats, memory, explored)
 
 def depth_limited_search(problem, limit=50):
     "[Fig. 3.17]"
     def recursive_dls(node, problem, limit):
         if problem.goal_test(node.state):
             return node
-        elif node.depth == limit:
+        elif limit == 0:
             return 'cutoff'
         else:
             cutoff_occurred = False
             for child in node.expand(problem):
-                result = recursive_dls(child, problem, limit)
+                result = recursive_dls(child, problem, limit - 1)
                 if result == 'cutoff':
                     cutoff_occurred = True
                 elif result is not None:
@@ -412,18 +809,184 @@ def iterative_deepening_search(problem):
         if result != 'cutoff':
             return result
 
+def bidirectional_breadth_first_search(problem):
+    """Search forward from the initial state and backward from
+    problem.goal_states() with problem.predecessors, one whole layer at a
+    time on the side with the smaller layer, until the two searches meet.
+    Each side only has to reach about half the solution depth. The solution
+    has the fewest steps; its node is built as the other searches do, with
+    the path costs given by problem.path_cost."""
+    if problem.goal_test(problem.initial):
+        return Node(problem.initial)
+    # state -> (parent_state, action, depth) on the forward side and
+    # state -> (next_state, action, depth) on the backward side
+    forward = {problem.initial: (None, None, 0)}
+    backward = {state: (None, None, 0) for state in problem.goal_states()}
+    if problem.initial in backward:
+        return Node(problem.initial)
+    forward_layer, backward_layer = [problem.initial], list(backward)
+    while forward_layer and backward_layer:
+        meeting = None
+        if len(forward_layer) <= len(backward_layer):
+            next_layer = []
+            for state in forward_layer:
+                depth = forward[state][2] + 1
+                for action, child_state, _ in Node(state).successors(problem):
+                    if child_state in forward:
+                        continue
+                    forward[child_state] = (state, action, depth)
+                    next_layer.append(child_state)
+                    if child_state in backward and (meeting is None or
+                            backward[child_state][2] < backward[meeting][2]):
+                        meeting = child_state
+            forward_layer = next_layer
+        else:
+            next_layer = []
+            for state in backward_layer:
+                depth = backward[state][2] + 1
+                for action, parent_state in problem.predecessors(state):
+                    if parent_state in backward:
+                        continue
+                    backward[parent_state] = (state, action, depth)
+                    next_layer.append(parent_state)
+                    if parent_state in forward and (meeting is None or
+                            forward[parent_state][2] < forward[meeting][2]):
+                        meeting = parent_state
+            backward_layer = next_layer
+        if meeting is not None:
+            return _join_paths(problem, forward, backward, meeting)
+    return None
+
+def _join_paths(problem, forward, backward, meeting):
+    "Build the goal node of the path through the state where the searches met."
+    steps = []
+    state = meeting
+    while forward[state][0] is not None:
+        parent_state, action, _ = forward[state]
+        steps.append((parent_state, action, state))
+        state = parent_state
+    steps.reverse()
+    state = meeting
+    while backward[state][0] is not None:
+        next_state, action, _ = backward[state]
+        steps.append((state, action, next_state))
+        state = next_state
+
+    node = Node(problem.initial)
+    for state, action, next_state in steps:
+        node = Node(next_state, node, action,
+                    problem.path_cost(node.path_cost, state, action, next_state))
+    return node
+
 #______________________________________________________________________________
 # Informed (Heuristic) Search
 
 greedy_best_first_graph_search = best_first_graph_search
     # Greedy best-first search is accomplished by specifying f(n) = h(n).
 
-def astar_graph_search(problem, h=None):
+def astar_graph_search(problem, h=None, stats=None, memory=None, explored=None):
     """A* search is best-first graph search with f(n) = g(n)+h(n).
     You need to specify the h function when you call astar_search, or
-    else in your Problem subclass."""
+    else in your Problem subclass.
+    h is not memoized: best_first_graph_search keeps the f of each node
+    in its frontier entry, so h is called once per node built."""
+    h = h or problem.h
+    return best_first_graph_search(problem, lambda n: n.path_cost + h(n), stats, memory, explored)
+
+
+def memory_bounded_astar_search(problem, memory, h=None, stats=None, table_size=1 << 20, explored=None):
+    """A* graph search within the MemoryBudget memory. If it goes over the
+    budget, its frontier and explored set are dropped and the problem is
+    solved again with iterative_deepening_astar_search, whose memory is
+    bounded by its table_size. Both searches return an optimal solution
+    with an admissible h. IDA* does not update the counters of stats,
+    which are then marked as not counted."""
+    try:
+        return astar_graph_search(problem, h, stats, memory, explored)
+    except MemoryLimitExceeded:
+        pass
+    # IDA* only starts after the except block, whose exception holds the
+    # frame of the aborted search and so its frontier; explored may also
+    # be held by the caller, so it is emptied
+    if explored is not None:
+        explored.clear()
+    if stats is not None:
+        stats.counted = False
+    return iterative_deepening_astar_search(problem, h, table_size)
+
+
+def weighted_astar_graph_search(problem, weight=2.0, h=None, stats=None, memory=None, explored=None):
+    """Weighted A* search is best-first graph search with
+    f(n) = g(n) + weight*h(n). Inflating h makes the search greedier and
+    much faster; with a consistent h the cost of the solution found is at
+    most weight times the optimal cost."""
+    h = h or problem.h
+    return best_first_graph_search(problem, lambda n: n.path_cost + weight * h(n), stats, memory, explored)
+
+
+def anytime_repairing_astar_search(problem, weight=3.0, weight_step=0.5, time_limit=None, h=None):
+    """Anytime Repairing A* (ARA*, Likhachev et al. 2003).
+    A first solution is found quickly with weighted A*, then the weight is
+    lowered by weight_step and the search resumes, reusing the nodes it has
+    already generated, to improve the solution until the weight reaches 1
+    or time_limit seconds have passed. The time limit does not stop the
+    search for the first solution. h must be consistent.
+    Returns a pair (node, bound) where node is the best goal node found, or
+    None if there is no solution, and its cost is proven at most bound
+    times the optimal cost."""
     h = memoize(h or problem.h)
-    return best_first_graph_search(problem, lambda n: n.path_cost + h(n))
+    deadline = None if time_limit is None else time.time() + time_limit
+    root = Node(problem.initial)
+    if problem.goal_test(root.state):
+        return root, 1.0
+    best = {root.state: root} # state -> node of its cheapest path so far
+    incumbent = None # best goal node so far
+    weight_bound = infinity # lowest weight whose search was completed
+    opened, inconsistent = [root], []
+    while True:
+        # the nodes left open by the previous weight are searched again
+        # with the new one, together with the closed nodes since improved
+        frontier = PriorityQueue(lambda n: n.path_cost + weight * h(n))
+        frontier.extend(node for node in opened + inconsistent if best[node.state] is node)
+        closed, inconsistent = set(), []
+        timed_out = False
+        while frontier:
+            if incumbent is not None and deadline is not None and time.time() > deadline:
+                timed_out = True
+                break
+            node = frontier.pop()
+            if incumbent is not None and incumbent.path_cost <= frontier.f(node):
+                frontier.append(node)
+                break
+            closed.add(node.state)
+            for action, child_state, path_cost in node.successors(problem):
+                incumbent_child = best.get(child_state)
+                if incumbent_child is not None and incumbent_child.path_cost <= path_cost:
+                    continue
+                child = Node(child_state, node, action, path_cost)
+                best[child_state] = child
+                if problem.goal_test(child_state):
+                    if incumbent is None or path_cost < incumbent.path_cost:
+                        incumbent = child
+                elif child_state in closed:
+                    inconsistent.append(child)
+                else:
+                    frontier.append(child)
+        opened = list(frontier.entries)
+        if not timed_out:
+            weight_bound = weight
+
+        if incumbent is None:
+            if not opened + inconsistent:
+                return None, infinity
+        else:
+            # no solution is cheaper than the lowest g+h of the nodes left
+            lower_bound = min([node.path_cost + h(node) for node in opened + inconsistent
+                               if best[node.state] is node] + [incumbent.path_cost])
+            bound = incumbent.path_cost / lower_bound if lower_bound > 0 else 1.0
+            if timed_out or weight <= 1 or bound <= 1:
+                return incumbent, min(bound, weight_bound)
+        weight = max(1.0, weight - weight_step)
 
 
 def astar_tree_search(problem, h=None):
@@ -433,3 +996,47 @@ def astar_tree_search(problem, h=None):
     h = h or problem.h
     return best_first_tree_search(problem, lambda n: n.path_cost + h(n))
 
+
+def iterative_deepening_astar_search(problem, h=None, table_size=1 << 20):
+    """IDA* search: repeated depth-first searches that cut off the nodes
+    with f(n) = g(n)+h(n) above a bound, raised in each iteration to the
+    smallest f that was cut off. With an admissible h the first solution
+    found is optimal. Only the current path and the children waiting on it
+    are kept, on an explicit stack, plus a TranspositionTable of table_size
+    slots that prunes states reached again at no lower cost. The children
+    of a node are searched in increasing order of f.
+    Each iteration raises the bound to the next f cut off, so the number of
+    iterations grows with the number of distinct path costs: costs on very
+    different scales, such as a large cost per push plus one per move, make
+    it impractical."""
+    h = h or problem.h
+    root = Node(problem.initial)
+    bound = root.path_cost + h(root)
+    table = TranspositionTable(table_size)
+    for iteration in itertools.count():
+        next_bound = infinity
+        stack = [[root]]  # for each depth, the nodes left to search
+        while stack:
+            if not stack[-1]:
+                stack.pop()
+                continue
+            node = stack[-1].pop()
+            if problem.goal_test(node.state):
+                return node
+            if table.visited(node.state, node.path_cost, iteration):
+                continue
+            children = []
+            for action, child_state, path_cost in node.successors(problem):
+                child = Node(child_state, node, action, path_cost)
+                f = path_cost + h(child)
+                if f > bound:
+                    next_bound = min(next_bound, f)
+                else:
+                    children.append((f, child))
+            # the best child is popped first
+            children.sort(key=lambda entry: entry[0], reverse=True)
+            stack.append([child for _, child in children])
+        if next_bound == infinity:
+            return None
+        bound = next_bound
+
@@ -1,8 +1,13 @@
 from sokoban import Warehouse
 from mySokobanSolver import *
+import reportGenerator
 
 import glob
+import os
+import csv
+import tempfile
 import time
+import random
 import multiprocessing as mp
 import multiprocessing.queues as mpq
 from typing import Tuple, Callable, Dict
@@ -25,6 +30,41 @@ def test_taboo_cells():
         print(answer)
 
 
+def benchmark_taboo_cells():
+    all_warehouses = sorted(glob.glob('warehouses/*.txt'))
+    fcn = benchmark_taboo_cells
+    print('<<  Running {} >>'.format(fcn.__name__))
+
+    time_list, time_array = 0, 0
+    num_of_mismatch: int = 0
+    for problem_file in all_warehouses:
+        wh = Warehouse()
+        try:
+            wh.load_warehouse(problem_file)
+        except Exception as e:
+            print("An error occurred when loading the warehouse.")
+            continue
+
+        s = time.time()
+        answer_list = getTabooCellsList(wh.walls, wh.targets)
+        time_list += time.time() - s
+        s = time.time()
+        answer_array = getTabooCellsArray(wh.walls, wh.targets)
+        time_array += time.time() - s
+
+        if set(answer_list) != set(answer_array):
+            num_of_mismatch += 1
+            print(f'{problem_file}: taboo cells differ')
+
+    print(f'getTabooCellsList: {time_list:.3f} seconds')
+    print(f'getTabooCellsArray: {time_array:.3f} seconds')
+    if num_of_mismatch == 0:
+        print(fcn.__name__, ' passed!  :-)\n')
+    else:
+        print(fcn.__name__, ' failed!  :-(\n')
+        print(f'{num_of_mismatch} warehouses have different taboo cells')
+
+
 def test_check_elem_action_seq():
     wh = Warehouse()
     wh.load_warehouse("./warehouses/warehouse_0001.txt")
@@ -165,6 +205,596 @@ def test_solve_sokoban_macro():
         print(answer)
 
 
+def test_expand_macro_solution():
+    puzzle_t2 = '#######\n#@ $ .#\n#######'
+    wh = Warehouse()
+    wh.extract_locations(puzzle_t2.split(sep='\n'))
+    # first test
+    answer = expand_macro_solution(wh, [((1, 3), 'Right'), ((1, 4), 'Right')])
+    expected_answer = ['Right', 'Right', 'Right']
+    fcn = test_expand_macro_solution
+    print('<<  First test of {} >>'.format(fcn.__name__))
+    if answer == expected_answer:
+        print(fcn.__name__, ' passed!  :-)\n')
+    else:
+        print(fcn.__name__, ' failed!  :-(\n')
+        print('Expected ');
+        print(expected_answer)
+        print('But, received ');
+        print(answer)
+    # second test
+    answer = expand_macro_solution(wh, [((1, 3), 'Left')])
+    expected_answer = 'Failure'
+    print('<<  Second test of {} >>'.format(fcn.__name__))
+    if answer == expected_answer:
+        print(fcn.__name__, ' passed!  :-)\n')
+    else:
+        print(fcn.__name__, ' failed!  :-(\n')
+        print('Expected ');
+        print(expected_answer)
+        print('But, received ');
+        print(answer)
+    # third test, the worker would have to stand on the other box
+    puzzle_t3 = '########\n#@$$ ..#\n########'
+    wh = Warehouse()
+    wh.extract_locations(puzzle_t3.split(sep='\n'))
+    answer = expand_macro_solution(wh, [((1, 3), 'Right')])
+    expected_answer = 'Failure'
+    print('<<  Third test of {} >>'.format(fcn.__name__))
+    if answer == expected_answer:
+        print(fcn.__name__, ' passed!  :-)\n')
+    else:
+        print(fcn.__name__, ' failed!  :-(\n')
+        print('Expected ');
+        print(expected_answer)
+        print('But, received ');
+        print(answer)
+
+
+def check_deadlock_rule(puzzle, box_pos, rule_name, expected_answer):
+    wh = Warehouse()
+    wh.extract_locations(puzzle.split(sep='\n'))
+    index = get_warehouse_index(wh)
+    rule = getattr(DeadlockDetector(index), rule_name)
+    answer = rule(encode_cells(wh.boxes, index.cell_index), index.cell_index[box_pos])
+    if not answer:
+        # a configuration the rule keeps must still be solvable
+        answer = solve_sokoban_macro(wh) == 'Impossible'
+    fcn = test_deadlock_detector
+    print('<<  Test of the {} rule in {} >>'.format(rule_name, fcn.__name__))
+    if answer == expected_answer:
+        print(fcn.__name__, ' passed!  :-)\n')
+    else:
+        print(fcn.__name__, ' failed!  :-(\n')
+        print('Expected ');
+        print(expected_answer)
+        print('But, received ');
+        print(answer)
+
+
+def test_packed_state_set():
+    fcn = test_packed_state_set
+    # keys differing only above the lowest 63 bits, in a 3 word table
+    # that starts with 16 slots and has to double a few times
+    key_bits = 130
+    keys = [0, (1 << key_bits) - 1, 1, 1 << 63, 1 << 64, 1 << 127, 1 << 129,
+            (1 << 63) | 1, (1 << 127) | 1, (1 << 63) - 1]
+    keys += [(index << 100) | index for index in range(2, 40)]
+    packed = search.PackedStateSet(lambda key: key, key_bits, capacity=16)
+    absent_before = [key in packed for key in keys]
+    for key in keys:
+        packed.add(key)
+        packed.add(key)
+    answer = (any(absent_before), all(key in packed for key in keys), len(packed),
+              (1 << 62) in packed, (1 << 128) in packed, 2 in packed)
+    expected_answer = (False, True, len(keys), False, False, False)
+    print('<<  First test of {} >>'.format(fcn.__name__))
+    if answer == expected_answer:
+        print(fcn.__name__, ' passed!  :-)\n')
+    else:
+        print(fcn.__name__, ' failed!  :-(\n')
+        print('Expected ');
+        print(expected_answer)
+        print('But, received ');
+        print(answer)
+    # random keys of one and of two words against a Python set
+    rng = random.Random(0)
+    num_of_mismatch: int = 0
+    for key_bits in (40, 100):
+        packed = search.PackedStateSet(lambda key: key, key_bits, capacity=16)
+        expected = set()
+        for _ in range(20000):
+            key = rng.getrandbits(rng.choice((8, key_bits)))
+            if (key in packed) != (key in expected):
+                num_of_mismatch += 1
+            packed.add(key)
+            expected.add(key)
+        if len(packed) != len(expected):
+            num_of_mismatch += 1
+    print('<<  Second test of {} >>'.format(fcn.__name__))
+    if num_of_mismatch == 0:
+        print(fcn.__name__, ' passed!  :-)\n')
+    else:
+        print(fcn.__name__, ' failed!  :-(\n')
+        print(f'{num_of_mismatch} operations differ from a set')
+
+
+def test_box_target_matching():
+    # a matching repaired after one box moved costs as much as one solved from scratch
+    fcn = test_box_target_matching
+    print('<<  Test of {} >>'.format(fcn.__name__))
+    rng = random.Random(0)
+    num_of_mismatch: int = 0
+    for number in (5, 33, 59, 103, 147):
+        wh = Warehouse()
+        wh.load_warehouse(f"./warehouses/warehouse_{number:04}.txt")
+        index = get_warehouse_index(wh)
+        matching = BoxTargetMatching(index.push_distances)
+        num_of_boxes = len(wh.targets)
+        for _ in range(500):
+            cells = rng.sample(range(len(index.cells)), num_of_boxes + 1)
+            boxes = sum(1 << cell for cell in cells[:num_of_boxes])
+            boxes_new = boxes & ~(1 << cells[0]) | 1 << cells[-1]
+            repaired = matching.repair(matching.solve(boxes), cells[0], cells[-1])
+            if repaired[-1] != matching.solve(boxes_new)[-1]:
+                num_of_mismatch += 1
+    if num_of_mismatch == 0:
+        print(fcn.__name__, ' passed!  :-)\n')
+    else:
+        print(fcn.__name__, ' failed!  :-(\n')
+        print(f'{num_of_mismatch} repaired matchings differ from the solved ones')
+
+
+def test_push_region():
+    # the region of the worker updated after a push is the one found by a full search
+    fcn = test_push_region
+    print('<<  Test of {} >>'.format(fcn.__name__))
+    rng = random.Random(0)
+    num_of_mismatch: int = 0
+    num_of_pushes: int = 0
+    for number in (5, 33, 59, 103, 147):
+        wh = Warehouse()
+        wh.load_warehouse(f"./warehouses/warehouse_{number:04}.txt")
+        index = get_warehouse_index(wh)
+        for _ in range(300):
+            num_of_boxes = rng.randint(1, len(index.cells) // 3)
+            cells = rng.sample(range(len(index.cells)), num_of_boxes + 1)
+            worker, boxes = cells[0], sum(1 << cell for cell in cells[1:])
+            region = get_reachable_cells(worker, boxes, index.neighbours)
+            for box in cells[1:]:
+                for direction, box_new in enumerate(index.neighbours[box]):
+                    behind = index.neighbours[box][direction ^ 1]  # Up/Down and Left/Right are paired
+                    if box_new < 0 or boxes >> box_new & 1 or behind < 0 or not region >> behind & 1:
+                        continue
+                    boxes_new = boxes & ~(1 << box) | 1 << box_new
+                    index.region_cache.clear()
+                    num_of_pushes += 1
+                    if (index.push_region(region, boxes_new, box, box_new)
+                            != get_reachable_cells(box, boxes_new, index.neighbours)):
+                        num_of_mismatch += 1
+    index.region_cache.clear()
+    if num_of_mismatch == 0 and num_of_pushes > 0:
+        print(fcn.__name__, ' passed!  :-)\n')
+    else:
+        print(fcn.__name__, ' failed!  :-(\n')
+        print(f'{num_of_mismatch} of {num_of_pushes} regions differ from a full search')
+
+
+def test_deadlock_detector():
+    # two boxes against the top wall close a 2x2 square of walls and boxes
+    check_deadlock_rule('########\n#.$$   #\n#  @  .#\n########', (3, 1), 'two_by_two', True)
+    # one row lower the square is open, and the puzzle is solvable
+    check_deadlock_rule('########\n#.     #\n# $$@ .#\n#      #\n########', (3, 2), 'two_by_two', False)
+    # each box blocks the other, one is against a wall on its left and the other on its right
+    check_deadlock_rule('########\n#   . .#\n# #$   #\n#  $#  #\n#   @  #\n########', (3, 2), 'frozen', True)
+    # without the wall on the right of the lower box, both boxes can move
+    check_deadlock_rule('########\n#   . .#\n# #$   #\n#  $   #\n#   @  #\n########', (3, 2), 'frozen', False)
+
+
+def test_deadlock_counters():
+    # the states pruned by each rule reach the search statistics and the report columns
+    fcn = test_deadlock_counters
+    print('<<  Test of {} >>'.format(fcn.__name__))
+    counts = {}
+    for number, rule in ((1, 'two_by_two'), (33, 'frozen')):
+        wh = Warehouse()
+        wh.load_warehouse(f"./warehouses/warehouse_{number:04}.txt")
+        stats = search.SearchStats()
+        reportGenerator.solve_sokoban_elem(wh, stats=stats)
+        counts[rule] = int(reportGenerator.format_stats(stats.as_dict())['pruned_' + rule] or 0)
+    if all(count > 0 for count in counts.values()):
+        print(fcn.__name__, ' passed!  :-)\n')
+    else:
+        print(fcn.__name__, ' failed!  :-(\n')
+        print(f'pruned states per rule: {counts}')
+
+
+def test_pruning_push_counts():
+    # pruning taboo pushes and deadlocks keeps the optimal number of pushes
+    fcn = test_pruning_push_counts
+    print('<<  Test of {} >>'.format(fcn.__name__))
+    num_of_mismatch: int = 0
+    for number in (1, 3, 5, 9, 19, 33, 47, 59, 69, 81, 103, 147):
+        wh = Warehouse()
+        wh.load_warehouse(f"./warehouses/warehouse_{number:04}.txt")
+        pruned = search.astar_graph_search(SokobanPuzzle(wh, macro=True))
+        unpruned = search.astar_graph_search(SokobanPuzzle(wh, macro=True, allow_taboo_push=True))
+        if pruned is None or unpruned is None or pruned.path_cost != unpruned.path_cost:
+            num_of_mismatch += 1
+            print(f'warehouse_{number:04}: pushes differ')
+    if num_of_mismatch == 0:
+        print(fcn.__name__, ' passed!  :-)\n')
+    else:
+        print(fcn.__name__, ' failed!  :-(\n')
+        print(f'{num_of_mismatch} warehouses have a different number of pushes')
+
+
+def test_corral_pruning():
+    # restricting the pushes to a PI-corral keeps the optimal number of pushes
+    fcn = test_corral_pruning
+    print('<<  Test of {} >>'.format(fcn.__name__))
+    num_of_mismatch: int = 0
+    num_of_restricted: int = 0
+    for number in (1, 3, 9, 19, 33, 47, 59, 69, 81, 103, 147):
+        wh = Warehouse()
+        wh.load_warehouse(f"./warehouses/warehouse_{number:04}.txt")
+        solver = SokobanPuzzle(wh, macro=True)
+        pruned = search.astar_graph_search(solver)
+        unpruned = search.astar_graph_search(SokobanPuzzle(wh, macro=True, corral_pruning=False))
+        num_of_restricted += solver.corral_counters['restricted']
+        if pruned is None or unpruned is None or pruned.path_cost != unpruned.path_cost:
+            num_of_mismatch += 1
+            print(f'warehouse_{number:04}: pushes differ')
+    if num_of_mismatch == 0 and num_of_restricted > 0:
+        print(fcn.__name__, ' passed!  :-)\n')
+    else:
+        print(fcn.__name__, ' failed!  :-(\n')
+        print(f'{num_of_mismatch} warehouses have a different number of pushes, '
+              f'{num_of_restricted} expansions were restricted to a corral')
+
+
+def test_macro_cost_modes():
+    # the 'moves' plans are as short as the elementary plans, the 'pushes_moves' plans keep the fewest pushes
+    fcn = test_macro_cost_modes
+    print('<<  Test of {} >>'.format(fcn.__name__))
+    num_of_mismatch: int = 0
+    for number in (1, 3, 9, 19, 33, 47, 69, 81):
+        wh = Warehouse()
+        wh.load_warehouse(f"./warehouses/warehouse_{number:04}.txt")
+        _, moves = reportGenerator.solve_sokoban_macro(wh, cost='moves')
+        elem_solution = solve_sokoban_elem(wh)
+        solution, pushes_moves = reportGenerator.solve_sokoban_macro(wh, cost='pushes_moves')
+        push_optimal = solve_sokoban_macro(wh)
+        actions = expand_macro_solution(wh, solution)
+        replayed = 'Failure' if actions == 'Failure' else check_action_seq(wh, actions)
+        if moves != len(elem_solution):
+            num_of_mismatch += 1
+            print(f'warehouse_{number:04}: {moves} moves with macro actions, {len(elem_solution)} with elementary ones')
+        if (len(solution) != len(push_optimal) or replayed == 'Failure' or '$' in replayed
+                or len(actions) != pushes_moves):
+            num_of_mismatch += 1
+            print(f'warehouse_{number:04}: the pushes_moves plan is not push optimal or does not replay')
+    if num_of_mismatch == 0:
+        print(fcn.__name__, ' passed!  :-)\n')
+    else:
+        print(fcn.__name__, ' failed!  :-(\n')
+        print(f'{num_of_mismatch} plans are wrong')
+
+
+def test_bidirectional_search():
+    # the pushes meeting from both ends are as few as with A* and replay to a solved warehouse
+    fcn = test_bidirectional_search
+    print('<<  Test of {} >>'.format(fcn.__name__))
+    num_of_mismatch: int = 0
+    num_of_goal_regions: int = 0
+    for number in (1, 9, 15, 47, 69, 79):
+        wh = Warehouse()
+        wh.load_warehouse(f"./warehouses/warehouse_{number:04}.txt")
+        solver = SokobanPuzzle(wh, macro=True)
+        # the worker can end in several regions of the solved warehouse in 15, 47, 69 and 79
+        num_of_goal_regions = max(num_of_goal_regions, len(solver.goal_states()))
+        solution = search.bidirectional_breadth_first_search(solver)
+        optimal = search.astar_graph_search(SokobanPuzzle(wh, macro=True))
+        actions = 'Failure' if solution is None else expand_macro_solution(wh, solution.solution())
+        replayed = 'Failure' if actions == 'Failure' else check_action_seq(wh, actions)
+        if solution is None or solution.path_cost != optimal.path_cost or replayed == 'Failure' or '$' in replayed:
+            num_of_mismatch += 1
+            print(f'warehouse_{number:04}: the bidirectional plan differs from A*')
+    # a solved warehouse whose worker is walled off from the boxes needs no push
+    wh = Warehouse()
+    wh.extract_locations('#######\n#@#* ##\n#######'.split(sep='\n'))
+    solution = search.bidirectional_breadth_first_search(SokobanPuzzle(wh, macro=True))
+    if solution is None or solution.solution() != []:
+        num_of_mismatch += 1
+        print('the solved warehouse is not answered with an empty plan')
+    if num_of_mismatch == 0 and num_of_goal_regions > 1:
+        print(fcn.__name__, ' passed!  :-)\n')
+    else:
+        print(fcn.__name__, ' failed!  :-(\n')
+        print(f'{num_of_mismatch} warehouses have a wrong plan, '
+              f'at most {num_of_goal_regions} goal regions were searched')
+
+
+def test_idastar_search():
+    # IDA* finds plans as cheap as A*, also with a transposition table much smaller than the states searched
+    fcn = test_idastar_search
+    print('<<  Test of {} >>'.format(fcn.__name__))
+    num_of_mismatch: int = 0
+    for number in (1, 3, 5, 9, 19, 33, 47, 81):
+        wh = Warehouse()
+        wh.load_warehouse(f"./warehouses/warehouse_{number:04}.txt")
+        optimal = search.astar_graph_search(SokobanPuzzle(wh, macro=True))
+        for table_size in (1 << 20, 1 << 4):
+            solution = search.iterative_deepening_astar_search(SokobanPuzzle(wh, macro=True), table_size=table_size)
+            if (solution is None or solution.path_cost != optimal.path_cost
+                    or not reportGenerator.is_macro_solution(wh, solution.solution())):
+                num_of_mismatch += 1
+                print(f'warehouse_{number:04}: the IDA* plan with {table_size} table slots differs from A*')
+    if num_of_mismatch == 0:
+        print(fcn.__name__, ' passed!  :-)\n')
+    else:
+        print(fcn.__name__, ' failed!  :-(\n')
+        print(f'{num_of_mismatch} plans are wrong')
+
+
+def test_solve_sokoban_portfolio():
+    # the first verified plan wins the race, an unsolvable warehouse is answered 'Impossible'
+    fcn = test_solve_sokoban_portfolio
+    wh = Warehouse()
+    wh.load_warehouse("./warehouses/warehouse_0033.txt")
+    solution, num_steps = reportGenerator.solve_sokoban_portfolio(wh, timeout=60)
+    impossible_wh = Warehouse()
+    impossible_wh.extract_locations('#######\n#@ $ .#\n#$   .#\n#######'.split(sep='\n'))
+    impossible = reportGenerator.solve_sokoban_portfolio(impossible_wh, timeout=60)
+    try:
+        reportGenerator.solve_sokoban_portfolio(wh, configs=[{'search_method': 'unknown'}], timeout=60)
+        all_failed = 'no error'
+    except RuntimeError:
+        all_failed = 'RuntimeError'
+    answer = (solution != 'Impossible' and reportGenerator.is_macro_solution(wh, solution)
+              and num_steps == len(solution), impossible, all_failed)
+    expected_answer = (True, ('Impossible', None), 'RuntimeError')
+    print('<<  First test of {} >>'.format(fcn.__name__))
+    if answer == expected_answer:
+        print(fcn.__name__, ' passed!  :-)\n')
+    else:
+        print(fcn.__name__, ' failed!  :-(\n')
+        print('Expected ');
+        print(expected_answer)
+        print('But, received ');
+        print(answer)
+
+
+def test_anytime_search():
+    # a time limited run stays within its bound of the optimal cost, an unlimited run reaches it
+    fcn = test_anytime_search
+    print('<<  Test of {} >>'.format(fcn.__name__))
+    num_of_mismatch: int = 0
+    num_of_suboptimal: int = 0
+    for number, macro in ((5, False), (59, False), (69, False), (47, True), (69, True)):
+        wh = Warehouse()
+        wh.load_warehouse(f"./warehouses/warehouse_{number:04}.txt")
+        solve = reportGenerator.solve_sokoban_macro if macro else reportGenerator.solve_sokoban_elem
+        _, optimal_cost = solve(wh, 'astar')
+        first_stats, final_stats = search.SearchStats(), search.SearchStats()
+        _, first_cost = solve(wh, 'anytime', weight=3.0, time_limit=0, stats=first_stats)
+        _, final_cost = solve(wh, 'anytime', weight=3.0, stats=final_stats)
+        num_of_suboptimal += first_cost > optimal_cost
+        if not (1.0 <= first_stats.bound and first_cost <= first_stats.bound * optimal_cost
+                and final_cost == optimal_cost and final_stats.bound == 1.0):
+            num_of_mismatch += 1
+            print(f'warehouse_{number:04}: costs {first_cost} (bound {first_stats.bound}) and {final_cost} '
+                  f'(bound {final_stats.bound}), optimal cost {optimal_cost}')
+    if num_of_mismatch == 0 and num_of_suboptimal > 0:
+        print(fcn.__name__, ' passed!  :-)\n')
+    else:
+        print(fcn.__name__, ' failed!  :-(\n')
+        print(f'{num_of_mismatch} runs broke their bound, {num_of_suboptimal} first solutions were suboptimal')
+
+
+def test_priority_queue():
+    fcn = test_priority_queue
+    # items are (name, priority) pairs, keyed by name
+    queue = search.PriorityQueue(lambda item: item[1], key=lambda item: item[0])
+    queue.extend([('a', 5), ('b', 3), ('c', 4)])
+    queue.append(('a', 1)) # decrease the priority of 'a'
+    del queue['c']
+    answer = ('c' in queue, queue['a'], len(queue), [queue.pop() for _ in range(2)])
+    expected_answer = (False, ('a', 1), 2, [('a', 1), ('b', 3)])
+    print('<<  First test of {} >>'.format(fcn.__name__))
+    if answer == expected_answer:
+        print(fcn.__name__, ' passed!  :-)\n')
+    else:
+        print(fcn.__name__, ' failed!  :-(\n')
+        print('Expected ');
+        print(expected_answer)
+        print('But, received ');
+        print(answer)
+    # random updates, deletions and pops against a dict, the first item
+    # appended winning ties as in the queue
+    rng = random.Random(0)
+    queue = search.PriorityQueue(lambda item: item[1], key=lambda item: item[0])
+    expected, order = {}, 0
+    num_of_mismatch: int = 0
+    for _ in range(20000):
+        name = rng.randrange(200)
+        operation = rng.random()
+        if operation < 0.6:
+            order += 1
+            queue.append((name, rng.randrange(100)))
+            expected[name] = (queue[name][1], order)
+        elif operation < 0.8:
+            if name in expected:
+                del queue[name]
+                del expected[name]
+                # the heap is rebuilt once most of its entries are stale
+                if len(queue.heap) > 2 * len(expected) + 64:
+                    num_of_mismatch += 1
+        elif expected:
+            best = min(expected, key=lambda key: expected[key])
+            if queue.pop() != (best, expected.pop(best)[0]):
+                num_of_mismatch += 1
+        if len(queue) != len(expected):
+            num_of_mismatch += 1
+    print('<<  Second test of {} >>'.format(fcn.__name__))
+    if num_of_mismatch == 0:
+        print(fcn.__name__, ' passed!  :-)\n')
+    else:
+        print(fcn.__name__, ' failed!  :-(\n')
+        print(f'{num_of_mismatch} operations differ from a dict')
+
+
+def test_search_stats():
+    # the counters of a search agree with each other and with a timed run, the timers only fill in when timed
+    fcn = test_search_stats
+    print('<<  Test of {} >>'.format(fcn.__name__))
+    num_of_mismatch: int = 0
+    wh = Warehouse()
+    wh.load_warehouse("./warehouses/warehouse_0033.txt")
+    stats, timed_stats = search.SearchStats(), search.SearchStats(timed=True)
+    reportGenerator.solve_sokoban_elem(wh, stats=stats)
+    reportGenerator.solve_sokoban_elem(wh, stats=timed_stats)
+    counters, timed_counters = stats.as_dict(), timed_stats.as_dict()
+    phases = ['time_' + phase for phase in search.SearchStats.PHASES]
+    if not (0 < stats.expanded <= stats.generated and stats.duplicates <= stats.generated
+            and stats.improved <= stats.duplicates and stats.max_frontier > 0
+            and 0 < stats.max_explored <= stats.expanded):
+        num_of_mismatch += 1
+        print(f'inconsistent counters: {counters}')
+    if any(counters[counter] != timed_counters[counter]
+           for counter in search.SearchStats.COUNTERS if counter != 'peak_rss'):
+        num_of_mismatch += 1
+        print('timing the search changed its counters')
+    # SokobanPuzzle defines successors, h and goal_test, but neither actions nor result
+    if (any(counters[phase] is not None for phase in phases)
+            or not all(timed_counters['time_' + phase] > 0 for phase in ('successors', 'h', 'goal_test'))):
+        num_of_mismatch += 1
+        print(f'wrong timers: {[(phase, timed_counters[phase]) for phase in phases]}')
+    for search_method in ('idastar', 'bidirectional', 'anytime'):
+        stats = search.SearchStats()
+        reportGenerator.solve_sokoban_macro(wh, search_method, stats=stats)
+        if stats.counted or stats.as_dict()['expanded'] is not None:
+            num_of_mismatch += 1
+            print(f'{search_method} does not count its nodes, but its counters are not marked')
+    if num_of_mismatch == 0:
+        print(fcn.__name__, ' passed!  :-)\n')
+    else:
+        print(fcn.__name__, ' failed!  :-(\n')
+        print(f'{num_of_mismatch} checks failed')
+
+
+def test_batch_memory_limit():
+    # a job run after a large one in the same worker is only charged for the memory it adds
+    large_wh, small_wh = Warehouse(), Warehouse()
+    large_wh.load_warehouse("./warehouses/warehouse_0105.txt")
+    small_wh.load_warehouse("./warehouses/warehouse_0069.txt")
+    reportGenerator.init_batch_worker({'warehouse_0105.txt': large_wh, 'warehouse_0069.txt': small_wh})
+    elem_bfs = {'macro': False, 'search_method': 'bfs', 'name': 'elem_bfs'}
+    elem_astar = {'macro': False, 'search_method': 'astar', 'name': 'elem_astar'}
+    memory_limit = 20 << 20
+    reportGenerator.batch_job(('warehouse_0105.txt', elem_bfs, 5, 10, None, False))
+    _, _, result, _, _, stats = reportGenerator.batch_job(('warehouse_0069.txt', elem_astar, 60, 10, memory_limit,
+                                                           False))
+    answer = (result, stats['peak_rss'] <= memory_limit)
+    expected_answer = ('Solution found', True)
+    fcn = test_batch_memory_limit
+    print('<<  First test of {} >>'.format(fcn.__name__))
+    if answer == expected_answer:
+        print(fcn.__name__, ' passed!  :-)\n')
+    else:
+        print(fcn.__name__, ' failed!  :-(\n')
+        print('Expected ');
+        print(expected_answer)
+        print('But, received ');
+        print(answer)
+
+
+def test_memory_budget():
+    # A* stops at its state budget, bounded A* then switches to IDA*, and a batch job over its memory is not stored
+    fcn = test_memory_budget
+    print('<<  Test of {} >>'.format(fcn.__name__))
+    num_of_mismatch: int = 0
+    wh = Warehouse()
+    wh.load_warehouse("./warehouses/warehouse_0069.txt")
+    try:
+        search.astar_graph_search(SokobanPuzzle(wh), memory=search.MemoryBudget(max_states=100))
+        num_of_mismatch += 1
+        print('A* went over its budget of 100 states')
+    except search.MemoryLimitExceeded:
+        pass
+    for number in (19, 33, 47, 81):
+        wh = Warehouse()
+        wh.load_warehouse(f"./warehouses/warehouse_{number:04}.txt")
+        _, optimal_pushes = reportGenerator.solve_sokoban_macro(wh)
+        stats = search.SearchStats()
+        solution, pushes = reportGenerator.solve_sokoban_macro(wh, 'bounded_astar', stats=stats,
+                                                               memory=search.MemoryBudget(max_states=20))
+        # the counters are only marked as not counted once IDA* took over
+        if (pushes != optimal_pushes or stats.counted or solution == 'Impossible'
+                or not reportGenerator.is_macro_solution(wh, solution)):
+            num_of_mismatch += 1
+            print(f'warehouse_{number:04}: bounded A* did not fall back to an optimal IDA* plan')
+    if search.current_rss() is None:
+        print('the resident set size cannot be read, the memory limit of a batch job is not checked')
+    else:
+        elem_bfs = {'macro': False, 'search_method': 'bfs', 'name': 'elem_bfs'}
+        with tempfile.TemporaryDirectory() as directory:
+            results_db = os.path.join(directory, 'results.sqlite')
+            csv_file = os.path.join(directory, 'results.csv')
+            reportGenerator.testAllParallel(number=69, methods=[elem_bfs], processes=1, csv_file=csv_file,
+                                            results_db=results_db, memory_limit=1)
+            with open(csv_file, newline='') as f:
+                results = [row['Result'] for row in csv.DictReader(f)]
+            warehouse_hash = reportGenerator.file_hash('./warehouses/warehouse_0069.txt')
+            store = reportGenerator.ResultsStore(results_db)
+            stored = store.get(warehouse_hash, 'elem_bfs', 180)
+            store.close()
+        if results != ['MemoryLimit'] or stored is not None:
+            num_of_mismatch += 1
+            print(f'the batch job gave {results} and stored {stored}')
+    if num_of_mismatch == 0:
+        print(fcn.__name__, ' passed!  :-)\n')
+    else:
+        print(fcn.__name__, ' failed!  :-(\n')
+        print(f'{num_of_mismatch} checks failed')
+
+
+def test_results_store():
+    # a rerun only writes the stored results, which another solver version does not see
+    fcn = test_results_store
+    print('<<  Test of {} >>'.format(fcn.__name__))
+    methods = [{'macro': True, 'search_method': 'astar', 'name': 'macro_astar'},
+               {'macro': False, 'search_method': 'astar', 'name': 'elem_astar'}]
+    with tempfile.TemporaryDirectory() as directory:
+        results_db = os.path.join(directory, 'results.sqlite')
+        csv_file = os.path.join(directory, 'results.csv')
+        reportGenerator.testAllParallel(number=5, timeout=60, methods=methods, processes=2, csv_file=csv_file,
+                                        results_db=results_db)
+        # a job solved again would overwrite this time
+        store = reportGenerator.ResultsStore(results_db)
+        store.connection.execute('UPDATE results SET time = 1234.5')
+        store.connection.commit()
+        store.close()
+        reportGenerator.testAllParallel(number=5, timeout=60, methods=methods, processes=2, csv_file=csv_file,
+                                        results_db=results_db)
+        with open(csv_file, newline='') as f:
+            rows = list(csv.DictReader(f))
+        warehouse_hash = reportGenerator.file_hash('./warehouses/warehouse_0005.txt')
+        stale_store = reportGenerator.ResultsStore(results_db, version='another version')
+        stale = [stale_store.get(warehouse_hash, method['name'], 60) for method in methods]
+        stale_store.close()
+    answer = ([(row['Result'], row['Time']) for row in rows], stale)
+    expected_answer = ([('Solution found', '1234.500s')] * len(methods), [None] * len(methods))
+    if answer == expected_answer:
+        print(fcn.__name__, ' passed!  :-)\n')
+    else:
+        print(fcn.__name__, ' failed!  :-(\n')
+        print('Expected ');
+        print(expected_answer)
+        print('But, received ');
+        print(answer)
+
+
 def test_warehouse(problem_file, macro=False, limit_of_boxes=3):
     '''
     This function will test the performance of your warehouse for either macro or elem solutions and return the result.
@@ -251,12 +881,31 @@ def testAll(number=-1, macro=False, timeout=180, limit_of_boxes=6):
 if __name__ == '__main__':
     print("Team:", my_team(), "\n")
     test_taboo_cells()
+    benchmark_taboo_cells()
     test_check_elem_action_seq()
     test_solve_sokoban_elem()
     test_can_go_there()
     test_can_go_there_custom(191, (12, 1), True)
     test_can_go_there_custom(191, (1, 17), False)
     test_solve_sokoban_macro()
+    test_expand_macro_solution()
+    test_bidirectional_search()
+    test_idastar_search()
+    test_anytime_search()
+    test_solve_sokoban_portfolio()
+    test_priority_queue()
+    test_packed_state_set()
+    test_box_target_matching()
+    test_push_region()
+    test_deadlock_detector()
+    test_deadlock_counters()
+    test_pruning_push_counts()
+    test_corral_pruning()
+    test_macro_cost_modes()
+    test_search_stats()
+    test_batch_memory_limit()
+    test_memory_budget()
+    test_results_store()
 
     testAll(5)
     testAll(5, macro=True)